@@ -0,0 +1,87 @@
+"""
+Device-side half of the app catalog scan: labels and icon drawables read over adb.
+Used by main.py directly and by device_owner.py when device I/O is routed to owners.
+
+`adb` is the host-side command prefix, e.g. ("adb", "-s", "192.168.1.100:5555").
+"""
+import os
+import shlex
+import subprocess
+
+from app_icons import extract_drawables
+
+
+# Function to execute a shell command and return output
+def run_command_for_system_Apps(command):
+    try:
+        result = subprocess.run(command, shell=True, text=True, capture_output=True)
+        if result.returncode == 0:
+            return result.stdout.strip()
+        else:
+            return None
+    except Exception as e:
+        return None
+
+
+# Function to get the application label directly using dumpsys
+def get_application_labels(app_id, adb=("adb",)):
+    command = f"{shlex.join(adb)} shell dumpsys package {app_id} | grep 'ApplicationLabel'"
+    output = run_command_for_system_Apps(command)
+    if output:
+        return output.split(":")[-1].strip()
+    return "Unknown"
+
+
+# Function to pull an app's APK into working_dir, returns the local path or None
+def pull_apk(app_id, working_dir, adb=("adb",)):
+    apk_paths = run_command_for_system_Apps(f"{shlex.join(adb)} shell pm path {app_id}")
+    if not apk_paths:
+        return None
+    apk_path = apk_paths.splitlines()[0].split(":")[1]
+    apk_file = os.path.join(working_dir, f"{app_id}.apk")
+    if run_command_for_system_Apps(f"{shlex.join(adb)} pull {apk_path} {apk_file}") is None:
+        return None
+    return apk_file
+
+
+# Function to process a single app ID
+def process_app_ids(app_id, working_dir, adb=("adb",)):
+    app_label = get_application_labels(app_id, adb)
+    if app_label != "Unknown":
+        return {"app_id": app_id, "app_name": app_label}
+
+    apk_paths = run_command_for_system_Apps(f"{shlex.join(adb)} shell pm path {app_id}")
+    if not apk_paths:
+        return {"app_id": app_id, "app_name": "Not Found"}
+
+    apk_file = pull_apk(app_id, working_dir, adb)
+    if not apk_file:
+        return {"app_id": app_id, "app_name": "Pull Failed"}
+
+    aapt_command = f"aapt dump badging {apk_file} | grep 'application-label'"
+    aapt_output = run_command_for_system_Apps(aapt_command)
+    if aapt_output:
+        label = aapt_output.split(":")[-1].strip().strip("'")
+        return {"app_id": app_id, "app_name": label}
+
+    return {"app_id": app_id, "app_name": "Unknown"}
+
+
+def pull_app_drawables(app_id, working_dir, adb=("adb",)):
+    """
+    Launcher icon and TV banner of an installed app ({kind: raw image bytes}), or
+    None if the APK couldn't be pulled. An APK left by the label fallback is reused.
+    """
+    apk_file = os.path.join(working_dir, f"{app_id}.apk")
+    pulled = False
+    if not os.path.exists(apk_file):
+        apk_file = pull_apk(app_id, working_dir, adb)
+        if not apk_file:
+            return None
+        pulled = True
+    try:
+        return extract_drawables(apk_file)
+    finally:
+        # Only the label fallback keeps its APK around, icon pulls are discarded
+        if pulled and os.path.exists(apk_file):
+            os.remove(apk_file)
@@ -0,0 +1,241 @@
+import os
+import re
+import csv
+import hashlib
+import zipfile
+import threading
+import subprocess
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image
+
+
+# Icons live next to the app label CSV, stored by the sha256 of the source drawable
+ICON_DIR_NAME = "icons"
+ICON_INDEX_FILE = "icon_index.csv"
+ICON_KINDS = ("icon", "banner")
+# Index row written for every extraction attempt, so apps without a usable
+# drawable (XML-only adaptive icon, undecodable image) aren't pulled again
+ATTEMPTED_KIND = "attempted"
+# Standard sizes served to the UI (bounding box, aspect ratio is kept)
+ICON_SIZES = (96, 256)
+DEFAULT_ICON_SIZE = 96
+# Number of resized icons kept in memory in front of the disk cache
+ICON_MEMORY_CACHE_SIZE = 256
+
+_RASTER_EXTENSIONS = (".png", ".webp", ".jpg", ".jpeg")
+_DENSITY_ORDER = ["xxxhdpi", "xxhdpi", "xhdpi", "hdpi", "tvdpi", "mdpi", "ldpi", "anydpi", "nodpi"]
+
+
+class IconCache:
+    """
+    Content-addressed icon store with a small in-memory LRU in front of the disk.
+
+    The on-disk layout is:
+        <working_dir>/icons/<sha256>.png          original drawable (normalised to PNG)
+        <working_dir>/icons/<sha256>_<size>.png   resized variants
+        <working_dir>/icon_index.csv              app_id,kind,hash ("attempted" rows have no hash)
+    """
+
+    def __init__(self, working_dir, memory_size=ICON_MEMORY_CACHE_SIZE):
+        self.icon_dir = os.path.join(working_dir, ICON_DIR_NAME)
+        self.index_path = os.path.join(working_dir, ICON_INDEX_FILE)
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._index = {}
+        os.makedirs(self.icon_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r", newline="") as csvfile:
+            reader = csv.DictReader(csvfile)
+            for row in reader:
+                self._index[(row["app_id"], row["kind"])] = row["hash"]
+
+    def _append_index(self, rows):
+        write_header = not os.path.exists(self.index_path)
+        with open(self.index_path, "a", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=["app_id", "kind", "hash"])
+            if write_header:
+                writer.writeheader()
+            writer.writerows(rows)
+
+    def has_icon(self, app_id, kind="icon"):
+        return (app_id, kind) in self._index
+
+    def was_indexed(self, app_id):
+        """True once extraction ran for the app, whether or not it produced an icon."""
+        return self.has_icon(app_id) or (app_id, ATTEMPTED_KIND) in self._index
+
+    def get_hash(self, app_id, kind="icon"):
+        return self._index.get((app_id, kind))
+
+    def _path(self, icon_hash, size=None):
+        name = f"{icon_hash}.png" if size is None else f"{icon_hash}_{size}.png"
+        return os.path.join(self.icon_dir, name)
+
+    def store(self, app_id, drawables):
+        """
+        Store the extracted drawables ({kind: image bytes}) for an app.
+        Decoding and resizing is CPU bound, so callers run this off the event loop.
+        """
+        rows = []
+        for kind, raw in drawables.items():
+            icon_hash = hashlib.sha256(raw).hexdigest()
+            if not os.path.exists(self._path(icon_hash)):
+                try:
+                    image = Image.open(BytesIO(raw))
+                    image.load()
+                except Exception as e:
+                    print(f"Could not decode {kind} for {app_id}: {e}")
+                    continue
+                image = image.convert("RGBA")
+                _write_atomic(self._path(icon_hash), _encode_png(image))
+                for size in ICON_SIZES:
+                    resized = image.copy()
+                    resized.thumbnail((size, size), Image.LANCZOS)
+                    _write_atomic(self._path(icon_hash, size), _encode_png(resized))
+            if self._index.get((app_id, kind)) != icon_hash:
+                rows.append({"app_id": app_id, "kind": kind, "hash": icon_hash})
+        stored = {row["kind"]: row["hash"] for row in rows}
+        if (app_id, ATTEMPTED_KIND) not in self._index:
+            rows.append({"app_id": app_id, "kind": ATTEMPTED_KIND, "hash": ""})
+        if rows:
+            with self._lock:
+                for row in rows:
+                    self._index[(row["app_id"], row["kind"])] = row["hash"]
+                self._append_index(rows)
+        return stored
+
+    def read(self, icon_hash, size):
+        """Return the PNG bytes for a stored icon, from memory when possible."""
+        key = (icon_hash, size)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+        path = self._path(icon_hash, size)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+        return data
+
+
+def _encode_png(image):
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _density_rank(path):
+    for rank, density in enumerate(_DENSITY_ORDER):
+        if f"-{density}" in path:
+            return rank
+    return len(_DENSITY_ORDER)
+
+
+def parse_badging_drawables(badging):
+    """
+    Pick the icon and banner resource paths out of `aapt dump badging` output.
+    The highest density application-icon-<dpi> entry wins over the plain icon= attribute.
+    """
+    drawables = {}
+    best_dpi = -1
+    for line in badging.splitlines():
+        match = re.match(r"application-icon-(\d+):'([^']+)'", line)
+        if match and int(match.group(1)) > best_dpi:
+            best_dpi = int(match.group(1))
+            drawables["icon"] = match.group(2)
+        elif line.startswith("application:"):
+            icon = re.search(r"icon='([^']+)'", line)
+            banner = re.search(r"banner='([^']+)'", line)
+            if icon and "icon" not in drawables:
+                drawables["icon"] = icon.group(1)
+            if banner:
+                drawables["banner"] = banner.group(1)
+    return drawables
+
+
+def _guess_drawables(names):
+    """Fallback when aapt is unavailable: look for conventional launcher/banner names."""
+    candidates = {"icon": [], "banner": []}
+    for name in names:
+        if not name.startswith("res/") or not name.lower().endswith(_RASTER_EXTENSIONS):
+            continue
+        base = os.path.basename(name).rsplit(".", 1)[0]
+        if base in ("ic_launcher", "app_icon", "icon", "ic_launcher_round"):
+            candidates["icon"].append(name)
+        elif "banner" in base:
+            candidates["banner"].append(name)
+    return {kind: sorted(paths, key=_density_rank)[0] for kind, paths in candidates.items() if paths}
+
+
+def _resolve_raster(names, resource_path):
+    """
+    Adaptive icons resolve to an XML drawable; fall back to a raster with the same
+    name in another density bucket.
+    """
+    if resource_path.lower().endswith(_RASTER_EXTENSIONS) and resource_path in names:
+        return resource_path
+    base = os.path.basename(resource_path).rsplit(".", 1)[0]
+    matches = [
+        name for name in names
+        if name.startswith("res/") and name.lower().endswith(_RASTER_EXTENSIONS)
+        and os.path.basename(name).rsplit(".", 1)[0] == base
+    ]
+    if not matches:
+        return None
+    return sorted(matches, key=_density_rank)[0]
+
+
+def extract_drawables(apk_file):
+    """
+    Read the launcher icon and TV banner out of a pulled APK.
+    Returns {kind: raw image bytes}.
+    """
+    badging = ""
+    try:
+        result = subprocess.run(
+            ["aapt", "dump", "badging", apk_file],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=30,
+            text=True
+        )
+        if result.returncode == 0:
+            badging = result.stdout
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+
+    drawables = {}
+    try:
+        with zipfile.ZipFile(apk_file) as apk:
+            names = set(apk.namelist())
+            resource_paths = parse_badging_drawables(badging) if badging else {}
+            if not resource_paths:
+                resource_paths = _guess_drawables(names)
+            for kind, resource_path in resource_paths.items():
+                raster = _resolve_raster(names, resource_path)
+                if raster:
+                    drawables[kind] = apk.read(raster)
+    except (zipfile.BadZipFile, OSError) as e:
+        print(f"Could not read APK {apk_file}: {e}")
+    return drawables
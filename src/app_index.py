@@ -0,0 +1,237 @@
+import os
+import re
+import csv
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+
+
+ALIAS_FILE_NAME = "app_aliases.csv"
+# Tokens too generic to identify an app on their own
+STOP_TOKENS = {"tv", "app", "apps", "the", "for", "and", "of", "plus", "free", "hd", "fire", "android"}
+MIN_TOKEN_LENGTH = 3
+# Phonetic keys of very short words collide too easily ("up", "ok")
+MIN_PHONETIC_QUERY_LENGTH = 4
+# A phonetic hit still has to look somewhat like what it matched
+PHONETIC_MIN_SIMILARITY = 0.5
+
+# Spoken digits, so "zee five" finds "ZEE5"
+NUMBER_WORDS = {
+    "zero": "0", "one": "1", "two": "2", "three": "3", "four": "4",
+    "five": "5", "six": "6", "seven": "7", "eight": "8", "nine": "9", "ten": "10",
+}
+
+# Score reported for each lookup tier, in the same 0-100 scale as search_app_name
+TIER_SCORES = {"alias": 100.0, "exact": 100.0, "joined": 98.0, "token": 90.0, "phonetic": 85.0}
+
+
+def normalize_name(name):
+    """Lowercase, strip accents and punctuation: "Disney+ Hotstar" -> "disney plus hotstar"."""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(ch for ch in name if not unicodedata.combining(ch)).lower()
+    name = name.replace("+", " plus ").replace("&", " and ")
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", name).split())
+
+
+def phonetic_key(word):
+    """
+    Metaphone-style sound key, so "sony live" / "sonyliv" and "net flicks" / "netflix"
+    share a key. Input is expected to be normalized and joined.
+    """
+    word = re.sub(r"[^a-z]", "", word)
+    if not word:
+        return ""
+    for prefix, replacement in (("kn", "n"), ("gn", "n"), ("pn", "n"), ("wr", "r"), ("ps", "s"), ("x", "s"), ("wh", "w")):
+        if word.startswith(prefix):
+            word = replacement + word[len(prefix):]
+            break
+    for pattern, replacement in (
+        ("tch", "ch"), ("sch", "sk"), ("ph", "f"), ("ck", "k"), ("gh", "g"), ("dg", "j"),
+        ("sh", "x"), ("ch", "x"), ("th", "0"), ("qu", "kw"), ("q", "k"), ("x", "ks"),
+        ("z", "s"), ("v", "f"),
+    ):
+        word = word.replace(pattern, replacement)
+    word = re.sub(r"c(?=[iey])", "s", word).replace("c", "k")
+    word = re.sub(r"g(?=[iey])", "j", word)
+    vowels = "aeiou"
+    key = []
+    for index, ch in enumerate(word):
+        following = word[index + 1] if index + 1 < len(word) else None
+        if ch in vowels:
+            if index == 0:
+                key.append("a")
+            continue
+        # w, y and h only sound before a vowel
+        if ch in "wyh" and (following is None or following not in vowels):
+            continue
+        if key and key[-1] == ch:
+            continue
+        key.append(ch)
+    return "".join(key)
+
+
+def name_variants(name):
+    """
+    All lookup keys for one app name. Returns {"exact": set, "joined": set, "token": set, "phonetic": set}.
+    """
+    normalized = normalize_name(name)
+    tokens = normalized.split()
+    variants = {"exact": set(), "joined": set(), "token": set(), "phonetic": set()}
+    if not tokens:
+        return variants
+    variants["exact"].add(normalized)
+    variants["joined"].add("".join(tokens))
+    # "Disney+ Hotstar" should also answer to "disney hotstar"
+    without_stop = [token for token in tokens if token not in STOP_TOKENS]
+    if without_stop and without_stop != tokens:
+        variants["exact"].add(" ".join(without_stop))
+        variants["joined"].add("".join(without_stop))
+    for token in without_stop:
+        if len(token) >= MIN_TOKEN_LENGTH:
+            variants["token"].add(token)
+    # Adjacent token pairs, so "prime video" finds "Amazon Prime Video"
+    for first, second in zip(without_stop, without_stop[1:]):
+        variants["token"].add(first + second)
+    for key in variants["joined"] | variants["token"]:
+        sound = phonetic_key(key)
+        if len(sound) >= 2:
+            variants["phonetic"].add(sound)
+    return variants
+
+
+class AppNameIndex:
+    """
+    Hash-map index over the app catalog so most spoken app names resolve without
+    scanning every app. Lookup tiers, strongest first: user alias, exact normalized
+    name, joined/split spelling, single token, phonetic key.
+    """
+
+    def __init__(self, working_dir=None):
+        self.alias_path = os.path.join(working_dir, ALIAS_FILE_NAME) if working_dir else None
+        self._lock = threading.Lock()
+        self.apps = {}  # app_id -> app_name
+        self.spellings = {}  # app_id -> joined/token keys, to vet phonetic hits
+        self.aliases = {}  # normalized alias -> app_id
+        self._alias_stamp = None
+        self.maps = {tier: {} for tier in ("exact", "joined", "token", "phonetic")}
+        self._load_aliases()
+
+    def _load_aliases(self):
+        """
+        (Re)load the alias CSV when it changed, so aliases confirmed on another
+        uvicorn worker are picked up here too.
+        """
+        if not self.alias_path:
+            return
+        try:
+            stat = os.stat(self.alias_path)
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._alias_stamp:
+            return
+        aliases = {}
+        with open(self.alias_path, "r", newline="") as csvfile:
+            reader = csv.DictReader(csvfile)
+            for row in reader:
+                aliases["".join(normalize_name(row["alias"]).split())] = row["app_id"]
+        self.aliases = aliases
+        self._alias_stamp = stamp
+
+    def build(self, app_data):
+        with self._lock:
+            self.apps = {}
+            self.spellings = {}
+            self.maps = {tier: {} for tier in self.maps}
+        for app in app_data:
+            self.add_app(app["app_id"], app["app_name"])
+
+    def add_app(self, app_id, app_name):
+        # Placeholder labels from a failed scan would match each other
+        if not app_name or app_name in ("Unknown", "Not Found", "Pull Failed"):
+            return
+        variants = name_variants(app_name)
+        with self._lock:
+            self.apps[app_id] = app_name
+            self.spellings[app_id] = variants["joined"] | variants["token"]
+            for tier, keys in variants.items():
+                for key in keys:
+                    self.maps[tier].setdefault(key, set()).add(app_id)
+
+    def all_aliases(self):
+        self._load_aliases()
+        return dict(self.aliases)
+
+    def add_alias(self, alias, app_id):
+        """Remember a confirmed correction, e.g. "hot star" -> in.startv.hotstar."""
+        key = "".join(normalize_name(alias).split())
+        if not key:
+            raise ValueError("Alias is empty.")
+        if app_id not in self.apps:
+            raise ValueError(f"Unknown app_id '{app_id}'.")
+        with self._lock:
+            self._load_aliases()
+            if self.aliases.get(key) == app_id:
+                return False
+            self.aliases[key] = app_id
+            if self.alias_path:
+                write_header = not os.path.exists(self.alias_path)
+                with open(self.alias_path, "a", newline="") as csvfile:
+                    writer = csv.DictWriter(csvfile, fieldnames=["alias", "app_id"])
+                    if write_header:
+                        writer.writeheader()
+                    writer.writerow({"alias": alias, "app_id": app_id})
+        return True
+
+    def _result(self, app_ids, query, tier):
+        results = [
+            {
+                "app_id": app_id,
+                "app_name": self.apps[app_id],
+                "similarity": TIER_SCORES[tier],
+                "match": tier
+            }
+            for app_id in app_ids if app_id in self.apps
+        ]
+        # Rank ties (e.g. two apps sharing a token) by how close the full name is
+        results.sort(key=lambda r: SequenceMatcher(None, query, normalize_name(r["app_name"])).ratio(), reverse=True)
+        return results
+
+    def lookup(self, query):
+        """
+        Resolve a spoken app name by hash lookups only. Returns a list of matches
+        (best first) or an empty list if the caller should fall back to fuzzy scoring.
+        """
+        normalized = normalize_name(query)
+        if not normalized:
+            return []
+        tokens = normalized.split()
+        joined = "".join(tokens)
+
+        self._load_aliases()
+        if joined in self.aliases:
+            return self._result([self.aliases[joined]], normalized, "alias")
+        if normalized in self.maps["exact"]:
+            return self._result(self.maps["exact"][normalized], normalized, "exact")
+
+        # Spellings to try: as heard, digits for number words ("zee five"),
+        # without generic words ("disney plus"), and singular ("hot stars")
+        spellings = [joined, "".join(NUMBER_WORDS.get(token, token) for token in tokens)]
+        core = "".join(token for token in tokens if token not in STOP_TOKENS)
+        if core:
+            spellings.append(core)
+        spellings += [spelling[:-1] for spelling in spellings if len(spelling) > 4 and spelling.endswith("s")]
+        for tier in ("joined", "token"):
+            for spelling in spellings:
+                if spelling in self.maps[tier]:
+                    return self._result(self.maps[tier][spelling], normalized, tier)
+
+        if len(joined) < MIN_PHONETIC_QUERY_LENGTH:
+            return []
+        sound = phonetic_key(joined)
+        candidates = self.maps["phonetic"].get(sound, set())
+        matches = [
+            app_id for app_id in candidates
+            if max(SequenceMatcher(None, joined, key).ratio() for key in self.spellings[app_id]) >= PHONETIC_MIN_SIMILARITY
+        ]
+        return self._result(matches, normalized, "phonetic")
@@ -0,0 +1,346 @@
+import asyncio
+import bisect
+import hashlib
+import hmac
+import ipaddress
+import itertools
+
+import orjson
+
+
+# Virtual nodes per owner on the hash ring, smooths the device distribution
+RING_REPLICAS = 64
+# Largest single frame accepted on the bus
+MAX_FRAME_SIZE = 4 * 1024 * 1024
+
+
+class BrokerError(Exception):
+    pass
+
+
+# Marks the end of a request's event stream
+_END_OF_EVENTS = object()
+
+
+async def _forward_events(events, on_event):
+    """
+    Deliver one request's streamed events to its callback. Runs as its own task so
+    a slow or failing callback only affects that request, not the shared connection.
+    """
+    while True:
+        event = await events.get()
+        if event is _END_OF_EVENTS:
+            return
+        await on_event(event)
+
+
+class HashRing:
+    """
+    Consistent hashing of device serials onto owner names, so adding or removing
+    an owner only moves the devices that hashed to it.
+    """
+
+    def __init__(self, nodes=(), replicas=RING_REPLICAS):
+        self.replicas = replicas
+        self._keys = []
+        self._nodes = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def add(self, node):
+        for replica in range(self.replicas):
+            key = self._hash(f"{node}#{replica}")
+            bisect.insort(self._keys, key)
+            self._nodes[key] = node
+
+    def remove(self, node):
+        for replica in range(self.replicas):
+            key = self._hash(f"{node}#{replica}")
+            if self._nodes.pop(key, None) is not None:
+                self._keys.remove(key)
+
+    def owner(self, key):
+        if not self._keys:
+            raise BrokerError("No device owners configured.")
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._nodes[self._keys[index]]
+
+
+def parse_address(address):
+    """"tcp://host:port" or "unix:///path/to.sock" -> ("tcp", host, port) / ("unix", path)."""
+    if address.startswith("unix://"):
+        return ("unix", address[len("unix://"):])
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://"):].rpartition(":")
+        return ("tcp", host or "127.0.0.1", int(port))
+    raise BrokerError(f"Unsupported broker address: {address}")
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def parse_owners(spec):
+    """Parse "owner-1=tcp://127.0.0.1:7001,owner-2=unix:///tmp/owner-2.sock"."""
+    owners = {}
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, address = entry.partition("=")
+        if not address:
+            raise BrokerError(f"Owner '{name}' has no address.")
+        parse_address(address)
+        owners[name.strip()] = address.strip()
+    return owners
+
+
+class InProcessBroker:
+    """
+    All owners live in this process. Same interface as SocketBroker, used for
+    single-process runs and tests.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+
+    def register(self, owner, handler):
+        self.handlers[owner] = handler
+
+    @property
+    def owners(self):
+        return list(self.handlers)
+
+    async def call(self, owner, message, on_event=None):
+        handler = self.handlers.get(owner)
+        if handler is None:
+            raise BrokerError(f"Unknown device owner '{owner}'.")
+
+        async def emit(event):
+            if on_event:
+                await on_event(event)
+
+        return await handler(orjson.loads(orjson.dumps(message)), emit)
+
+    async def close(self):
+        pass
+
+
+class _OwnerConnection:
+    """One multiplexed connection from a front worker to an owner."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}  # request id -> (future, event queue or None)
+        self.write_lock = asyncio.Lock()
+        self.reader_task = asyncio.create_task(self._read_loop())
+
+    async def _read_loop(self):
+        error = BrokerError("Connection to device owner closed.")
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                frame = orjson.loads(line)
+                future, events = self.pending.get(frame.get("id"), (None, None))
+                if future is None:
+                    continue
+                if "event" in frame:
+                    if events is not None:
+                        events.put_nowait(frame["event"])
+                elif "error" in frame:
+                    self.pending.pop(frame["id"], None)
+                    future.set_exception(BrokerError(frame["error"]))
+                else:
+                    self.pending.pop(frame["id"], None)
+                    future.set_result(frame.get("result"))
+        except Exception as e:
+            error = BrokerError(f"Device owner connection failed: {e}")
+        finally:
+            for future, _ in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.pending.clear()
+            self.writer.close()
+
+    @property
+    def closed(self):
+        return self.reader_task.done()
+
+    async def send(self, frame):
+        async with self.write_lock:
+            self.writer.write(orjson.dumps(frame) + b"\n")
+            await self.writer.drain()
+
+
+class SocketBroker:
+    """
+    Front-side client of the device owners, one newline-delimited JSON connection
+    per owner over TCP or a Unix socket.
+    """
+
+    def __init__(self, addresses, token=None):
+        self.addresses = addresses
+        self.token = token
+        self._connections = {}
+        self._connect_lock = asyncio.Lock()
+        self._ids = itertools.count(1)
+
+    @property
+    def owners(self):
+        return list(self.addresses)
+
+    async def _connection(self, owner):
+        connection = self._connections.get(owner)
+        if connection and not connection.closed:
+            return connection
+        async with self._connect_lock:
+            connection = self._connections.get(owner)
+            if connection and not connection.closed:
+                return connection
+            if owner not in self.addresses:
+                raise BrokerError(f"Unknown device owner '{owner}'.")
+            address = parse_address(self.addresses[owner])
+            try:
+                if address[0] == "unix":
+                    reader, writer = await asyncio.open_unix_connection(address[1], limit=MAX_FRAME_SIZE)
+                else:
+                    reader, writer = await asyncio.open_connection(address[1], address[2], limit=MAX_FRAME_SIZE)
+            except OSError as e:
+                raise BrokerError(f"Device owner '{owner}' is unreachable: {e}")
+            connection = _OwnerConnection(reader, writer)
+            self._connections[owner] = connection
+            return connection
+
+    async def call(self, owner, message, on_event=None):
+        connection = await self._connection(owner)
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        events = asyncio.Queue() if on_event else None
+        forwarder = asyncio.create_task(_forward_events(events, on_event)) if on_event else None
+        connection.pending[request_id] = (future, events)
+        frame = {"id": request_id, "message": message}
+        if self.token:
+            frame["token"] = self.token
+        try:
+            await connection.send(frame)
+            if forwarder is None:
+                return await future
+            # A failing callback (e.g. a closed websocket) ends this call right away
+            await asyncio.wait({future, forwarder}, return_when=asyncio.FIRST_COMPLETED)
+            if forwarder.done():
+                forwarder.result()
+            result = await future
+            # Let the events that arrived before the result reach the callback first
+            events.put_nowait(_END_OF_EVENTS)
+            await forwarder
+            return result
+        finally:
+            connection.pending.pop(request_id, None)
+            if forwarder and not forwarder.done():
+                forwarder.cancel()
+            # A cancelled caller cancels the awaited future too, so check for both
+            if future.cancelled() or not future.done():
+                # Abandoned (cancelled caller or failed callback): stop the owner's side too,
+                # which is how open-ended streams like logcat end
+                try:
+                    await connection.send({"id": request_id, "cancel": True})
+                except Exception:
+                    pass
+
+    async def close(self):
+        for connection in self._connections.values():
+            connection.writer.close()
+        self._connections.clear()
+
+
+async def serve_owner(handler, address, token=None):
+    """
+    Serve an owner's handler on the bus. Each request runs as its own task, so a
+    long macro on one device doesn't hold up another device's key presses.
+    """
+
+    async def on_connection(reader, writer):
+        write_lock = asyncio.Lock()
+        tasks = {}  # request id -> task
+
+        async def send(frame):
+            async with write_lock:
+                writer.write(orjson.dumps(frame) + b"\n")
+                await writer.drain()
+
+        async def run(frame):
+            request_id = frame.get("id")
+
+            async def emit(event):
+                await send({"id": request_id, "event": event})
+
+            try:
+                if token and not hmac.compare_digest(str(frame.get("token", "")), token):
+                    raise BrokerError("Invalid broker token.")
+                result = await handler(frame["message"], emit)
+                await send({"id": request_id, "result": result})
+            except Exception as e:
+                await send({"id": request_id, "error": str(e)})
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                frame = orjson.loads(line)
+                request_id = frame.get("id")
+                if frame.get("cancel"):
+                    # Request ids are per connection, so only this client's own requests can be cancelled
+                    task = tasks.get(request_id)
+                    if task:
+                        task.cancel()
+                    continue
+                task = asyncio.create_task(run(frame))
+                tasks[request_id] = task
+                task.add_done_callback(lambda _, request_id=request_id: tasks.pop(request_id, None))
+        except Exception as e:
+            print(f"Broker connection error: {e}")
+        finally:
+            for task in list(tasks.values()):
+                task.cancel()
+            writer.close()
+
+    kind = parse_address(address)
+    # Owners run device shell commands for whoever connects, so anything
+    # reachable from other hosts must require the shared secret
+    if kind[0] == "tcp" and not is_loopback(kind[1]) and not token:
+        raise BrokerError(f"BROKER_TOKEN is required to listen on {address}.")
+    if kind[0] == "unix":
+        return await asyncio.start_unix_server(on_connection, kind[1], limit=MAX_FRAME_SIZE)
+    return await asyncio.start_server(on_connection, kind[1], kind[2], limit=MAX_FRAME_SIZE)
+
+
+class DeviceRouter:
+    """
+    Routes device operations to the owner holding the device's channel.
+    """
+
+    def __init__(self, broker, owners=None):
+        self.broker = broker
+        self.ring = HashRing(owners or broker.owners)
+
+    def owner(self, device):
+        return self.ring.owner(device)
+
+    async def call(self, device, op, on_event=None, **payload):
+        if not device:
+            raise BrokerError("No device selected.")
+        message = {"op": op, "device": device, **payload}
+        return await self.broker.call(self.owner(device), message, on_event)
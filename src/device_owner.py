@@ -0,0 +1,206 @@
+"""
+Device-owner worker: holds the adb channels for the devices that hash to it and
+serves device operations to the front workers over the broker.
+
+    python device_owner.py owner-1 tcp://127.0.0.1:7001 --adb-port 5038
+"""
+import os
+import time
+import base64
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from app_catalog import process_app_ids, pull_app_drawables
+from broker import BrokerError, serve_owner
+from logcat import LogcatManager, LogFilter
+from macros import device_command, play_macro
+from package_snapshot import fetch_package_listing
+
+
+class DeviceOwner:
+    """
+    Executes device operations for its share of devices. Every adb call is pinned
+    to one device with -s, and optionally to this owner's own adb server with -P,
+    so several owners can run on one host. APKs pulled for labels and icons go to
+    `working_dir`.
+    """
+
+    def __init__(self, name, adb_port=None, working_dir=None):
+        self.name = name
+        self.adb_port = adb_port
+        self.working_dir = working_dir or tempfile.gettempdir()
+        self.connected = {}  # device -> bool
+        self.logcat = LogcatManager(self.adb())
+
+    def adb(self, device=None):
+        args = ["adb"]
+        if self.adb_port:
+            args += ["-P", str(self.adb_port)]
+        if device:
+            args += ["-s", device]
+        return args
+
+    async def handle(self, message, emit):
+        op = message.get("op")
+        device = message.get("device")
+        if not device:
+            raise BrokerError("No device selected.")
+        if op == "connect":
+            response = await asyncio.to_thread(self.connect, device)
+            if response["status_code"] == 200:
+                self.logcat.start(device)
+            return response
+        if op == "state":
+            return {"device": device, "owner": self.name, "connected": self.connected.get(device, False)}
+        if not self.connected.get(device):
+            # Streaming ops don't answer with a status dict, so they can't carry an error dict
+            if op in ("play", "logcat"):
+                raise BrokerError("ADB not connected. Connect first.")
+            return {"status_code": 500, "error_message": "ADB not connected. Connect first."}
+        if op == "run":
+            return await asyncio.to_thread(self.run, device, message["command"])
+        if op == "launch":
+            return await asyncio.to_thread(self.launch, device, message["app_id"])
+        if op == "packages":
+            return await asyncio.to_thread(self.packages, device)
+        if op == "labels":
+            return await asyncio.to_thread(self.labels, device, message["app_ids"])
+        if op == "drawables":
+            return await asyncio.to_thread(self.drawables, device, message["app_id"])
+        if op == "logcat":
+            return await self.stream_logcat(device, message, emit)
+        if op == "log_slice":
+            return self.log_slice(device, message["app_id"], message["since"])
+        if op == "play":
+            results = []
+            async for result in play_macro(message["steps"], message["commands"], adb=self.adb(device)):
+                results.append(result)
+                await emit(result)
+            return results
+        raise BrokerError(f"Unknown operation '{op}'.")
+
+    def _devices_output(self):
+        result = subprocess.run(self.adb() + ["devices"], capture_output=True, text=True, timeout=10)
+        return result.stdout
+
+    def connect(self, device):
+        """
+        Connect one device, polling like connect_adb but without restarting the
+        adb server, which would drop this owner's other devices.
+        """
+        try:
+            if f"{device}\tdevice" in self._devices_output():
+                self.connected[device] = True
+                return {"status_code": 200, "message": "ADB is already connected to the device."}
+
+            subprocess.run(self.adb() + ["connect", device], capture_output=True, text=True, timeout=15)
+            for attempt in range(30):  # Retry for 30 seconds
+                output = self._devices_output()
+                if f"{device}\tdevice" in output:
+                    self.connected[device] = True
+                    return {"status_code": 200, "message": "ADB connection successful."}
+                elif f"{device}\tunauthorized" in output:
+                    self.connected[device] = False
+                    return {"status_code": 401, "message": "ADB connection unauthorized. Please allow access on the device."}
+                time.sleep(1)
+
+            self.connected[device] = False
+            return {"status_code": 402, "message": "Connection attempt timed out. Please check your device and network."}
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self.connected[device] = False
+            return {"status_code": 500, "message": f"Error: {str(e)}"}
+
+    def run(self, device, command):
+        """Run one `adb shell ...` command from the commands table on the device."""
+        try:
+            result = subprocess.run(
+                self.adb(device) + ["shell", device_command(command)],
+                capture_output=True,
+                timeout=10,
+                text=True
+            )
+        except subprocess.TimeoutExpired:
+            return {"status_code": 500, "error_message": "ADB command timed out."}
+        if result.returncode != 0:
+            return {"status_code": result.returncode, "error_message": result.stderr.strip() or "Unknown error occurred"}
+        return {"status_code": 200, "output": result.stdout.strip()}
+
+    def launch(self, device, app_id):
+        """Same monkey / explicit activity fallback as open_apps."""
+        try:
+            result = subprocess.run(
+                self.adb(device) + ["shell", "monkey", "-p", app_id, "-c", "android.intent.category.LAUNCHER", "1"],
+                capture_output=True,
+                timeout=5,
+                text=True
+            )
+            if result.returncode != 0:
+                result = subprocess.run(
+                    self.adb(device) + ["shell", "am", "start", "-n", f"{app_id}/.MainActivity"],
+                    capture_output=True,
+                    timeout=5,
+                    text=True
+                )
+        except subprocess.TimeoutExpired:
+            return {"status_code": 500, "error_message": "ADB command timed out."}
+        if result.returncode != 0:
+            return {"status_code": 500, "error_message": f"Failed to launch app {app_id}: {result.stderr.strip()}"}
+        return {"status_code": 200, "message": f"App {app_id} opened successfully."}
+
+    async def stream_logcat(self, device, message, emit):
+        """Emit filtered logcat entries until the front worker cancels the request."""
+        log_filter = LogFilter.from_params(message.get("tag"), message.get("priority"), message.get("pid"), message.get("package"))
+        subscription = await self.logcat.get(device).subscribe(log_filter, backlog=message.get("backlog", 0))
+        try:
+            while True:
+                await emit(await subscription.queue.get())
+        finally:
+            subscription.close()
+
+    def log_slice(self, device, app_id, since):
+        reader = self.logcat.readers.get(device)
+        if not reader or not reader.running:
+            return {"status_code": 200, "entries": []}
+        return {"status_code": 200, "entries": reader.slice(app_id, since)}
+
+    def packages(self, device):
+        """Installed packages with version codes and the third-party subset, for the package snapshot."""
+        try:
+            packages, third_party = fetch_package_listing(device, self.adb())
+        except Exception as e:
+            return {"status_code": 500, "error_message": str(e)}
+        return {"status_code": 200, "packages": packages, "third_party": sorted(third_party)}
+
+    def labels(self, device, app_ids):
+        os.makedirs(self.working_dir, exist_ok=True)
+        labels = [process_app_ids(app_id, self.working_dir, self.adb(device)) for app_id in app_ids]
+        return {"status_code": 200, "labels": labels}
+
+    def drawables(self, device, app_id):
+        """Icon/banner image bytes, base64 encoded for the JSON bus; None if the APK couldn't be pulled."""
+        os.makedirs(self.working_dir, exist_ok=True)
+        drawables = pull_app_drawables(app_id, self.working_dir, self.adb(device))
+        if drawables is not None:
+            drawables = {kind: base64.b64encode(raw).decode() for kind, raw in drawables.items()}
+        return {"status_code": 200, "drawables": drawables}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run a device-owner worker.")
+    parser.add_argument("name", help="Owner name, as listed in DEVICE_OWNERS on the front workers")
+    parser.add_argument("address", help="tcp://host:port or unix:///path/to.sock")
+    parser.add_argument("--adb-port", type=int, help="Port of this owner's own adb server")
+    parser.add_argument("--working-dir", help="Where APKs are pulled for labels and icons (default: temp dir)")
+    args = parser.parse_args()
+
+    owner = DeviceOwner(args.name, adb_port=args.adb_port, working_dir=args.working_dir)
+    server = await serve_owner(owner.handle, args.address, token=os.environ.get("BROKER_TOKEN"))
+    print(f"Device owner '{args.name}' listening on {args.address}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
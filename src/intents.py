@@ -0,0 +1,239 @@
+import re
+
+
+# Upper bound for "volume up fifty" style repeats
+INTENT_MAX_REPEAT = 20
+# Pause before the step that follows an app launch, so the app has focus
+INTENT_LAUNCH_DELAY = 2.0
+
+CHAIN_SEPARATORS = re.compile(r"\s*(?:,|;|\band then\b|\bthen\b|\bafter that\b)\s*")
+# "and" chains clauses too, except inside a number ("channel one hundred and four")
+# or an app's name ("open tom and jerry")
+AND_SEPARATOR = re.compile(r"\s*(?<!\bhundred )(?<!\bthousand )\band\b\s*")
+# App matches that cover the whole spoken name, not just one of its words
+WHOLE_NAME_MATCHES = ("alias", "exact", "joined")
+
+UNITS = {
+    "zero": 0, "oh": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+    "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+TENS = {
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50,
+    "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+# Speech recognition regularly hears counts as homophones at the end of a phrase
+COUNT_HOMOPHONES = {"too": 2, "to": 2, "for": 4, "won": 1, "ate": 8}
+
+# Spoken variants of the entries in `commands`
+COMMAND_SYNONYMS = {
+    "select": "ok",
+    "enter": "ok",
+    "okay": "ok",
+    "press ok": "ok",
+    "go back": "back",
+    "return": "back",
+    "go home": "home",
+    "go to home": "home",
+    "louder": "volume up",
+    "quieter": "volume down",
+    "softer": "volume down",
+    "turn it up": "volume up",
+    "turn it down": "volume down",
+    "next channel": "channel up",
+    "previous channel": "channel down",
+    "turn on": "power on",
+    "turn off": "power off",
+}
+COMMAND_PREFIXES = ("please ", "go ", "move ", "press ", "hit ", "scroll ")
+
+DIGIT_COMMAND = "digit:{}"
+LAUNCH_COMMAND = "launch:{}"
+
+
+def digit_commands():
+    """Device commands for the number keys used by "channel 104"."""
+    return {DIGIT_COMMAND.format(d): f"adb shell input keyevent KEYCODE_{d}" for d in range(10)}
+
+
+def launch_command(app_id):
+    """Launch an app from inside a device script, mirroring open_apps' monkey/am start fallback."""
+    return (f"adb shell monkey -p {app_id} -c android.intent.category.LAUNCHER 1 >/dev/null 2>&1"
+            f" || am start -n {app_id}/.MainActivity")
+
+
+def starts_app(command_key, commands):
+    """True for app launches, including `commands` entries like "youtube" that are an `am start`."""
+    return command_key.startswith("launch:") or "am start" in commands.get(command_key, "")
+
+
+def parse_number(words):
+    """
+    Turn spoken number words into an int: "one hundred four" -> 104,
+    "one oh four" -> 104, "104" -> 104. Returns None if any word isn't a number.
+    """
+    if not words:
+        return None
+    if len(words) == 1 and words[0].isdigit():
+        return int(words[0])
+    # A run of single digits is read digit by digit ("one oh four")
+    if len(words) > 1 and all(word.isdigit() and len(word) == 1 or UNITS.get(word, 10) < 10 for word in words):
+        return int("".join(word if word.isdigit() else str(UNITS[word]) for word in words))
+    total = 0
+    current = 0
+    seen = False
+    for word in words:
+        if word == "and" and seen:
+            continue
+        seen = True
+        if word.isdigit():
+            current += int(word)
+        elif word in UNITS:
+            current += UNITS[word]
+        elif word in TENS:
+            current += TENS[word]
+        elif word == "hundred":
+            current = max(current, 1) * 100
+        elif word == "thousand":
+            total += max(current, 1) * 1000
+            current = 0
+        else:
+            return None
+    return total + current
+
+
+def split_count(words):
+    """
+    Split a trailing repeat count off a clause: "down three times" -> (["down"], 3).
+    """
+    words = list(words)
+    if words and words[-1] in ("times", "time"):
+        words = words[:-1]
+    if words and re.fullmatch(r"x\d+", words[-1]):
+        return words[:-1], int(words[-1][1:])
+    if len(words) > 1 and words[-1] in COUNT_HOMOPHONES:
+        return words[:-1], COUNT_HOMOPHONES[words[-1]]
+    # Longest numeric tail wins ("volume up twenty five")
+    for start in range(max(len(words) - 4, 1), len(words)):
+        count = parse_number(words[start:])
+        if count:
+            return words[:start], count
+    return words, 1
+
+
+def resolve_command(phrase, commands, extract_keywords):
+    """Map a clause without its count onto a key of `commands`."""
+    candidates = [phrase, COMMAND_SYNONYMS.get(phrase, "")]
+    stripped = phrase
+    for prefix in COMMAND_PREFIXES:
+        if stripped.startswith(prefix):
+            stripped = stripped[len(prefix):]
+    candidates += [stripped, COMMAND_SYNONYMS.get(stripped, ""), extract_keywords(phrase)]
+    for candidate in candidates:
+        if candidate in commands:
+            return candidate
+        if COMMAND_SYNONYMS.get(candidate) in commands:
+            return COMMAND_SYNONYMS[candidate]
+    return None
+
+
+UNRESOLVED_CLAUSE = "Could not understand '{}'."
+
+
+def parse_clause(clause, commands, extract_keywords, resolve_app):
+    """
+    Compile one clause into steps. Returns (steps, error).
+    """
+    words = re.sub(r"[^\w\s]", " ", clause.lower()).split()
+    if not words:
+        return [], None
+
+    # "channel 104", "go to channel one oh four"
+    if "channel" in words:
+        number = parse_number(words[words.index("channel") + 1:])
+        if number is not None:
+            return [{"command": DIGIT_COMMAND.format(digit), "clause": clause} for digit in str(number)], None
+
+    phrase_words, count = split_count(words)
+    command_key = resolve_command(" ".join(phrase_words), commands, extract_keywords) if phrase_words else None
+    if command_key:
+        if count > INTENT_MAX_REPEAT:
+            return [], f"'{clause}' repeats more than {INTENT_MAX_REPEAT} times."
+        return [{"command": command_key, "clause": clause} for _ in range(count)], None
+
+    app = resolve_app(clause)
+    if app:
+        return [{"command": LAUNCH_COMMAND.format(app["app_id"]), "clause": clause, "app_name": app["app_name"]}], None
+    return [], UNRESOLVED_CLAUSE.format(clause)
+
+
+def resolves_whole(clause, commands, extract_keywords, resolve_app):
+    """True when a clause containing "and" is itself a command or an app's full name."""
+    words = re.sub(r"[^\w\s]", " ", clause.lower()).split()
+    if resolve_command(" ".join(words), commands, extract_keywords):
+        return True
+    app = resolve_app(clause)
+    return bool(app) and app.get("match") in WHOLE_NAME_MATCHES
+
+
+def split_clauses(text, commands, extract_keywords, resolve_app):
+    """
+    Split an utterance into clauses. Runs of "and"-joined parts are kept together
+    when they resolve as a whole, longest run first.
+    """
+    clauses = []
+    for clause in CHAIN_SEPARATORS.split(text.strip()):
+        parts = AND_SEPARATOR.split(clause)
+        start = 0
+        while start < len(parts):
+            end = start + 1
+            for candidate_end in range(len(parts), start + 1, -1):
+                if resolves_whole(" and ".join(parts[start:candidate_end]), commands, extract_keywords, resolve_app):
+                    end = candidate_end
+                    break
+            clauses.append(" and ".join(parts[start:end]))
+            start = end
+    return clauses
+
+
+def compile_intent(text, commands, extract_keywords, resolve_app):
+    """
+    Compile an utterance like "mute then open youtube" or "go down three and select"
+    into one plan of steps that can be played in a single device round trip.
+    `resolve_app(clause)` returns the best app match ({"app_id", "app_name", "match"}) or None.
+
+    Returns {"steps": [...], "commands": {key: adb command}, "errors": [...], "unresolved": [clauses]}.
+    """
+    plan_commands = dict(commands)
+    plan_commands.update(digit_commands())
+    steps = []
+    errors = []
+    unresolved = []
+    for clause in split_clauses(text, commands, extract_keywords, resolve_app):
+        clause_steps, error = parse_clause(clause, commands, extract_keywords, resolve_app)
+        if error:
+            errors.append(error)
+            if error == UNRESOLVED_CLAUSE.format(clause):
+                unresolved.append(clause)
+        for step in clause_steps:
+            if step["command"].startswith("launch:"):
+                plan_commands[step["command"]] = launch_command(step["command"][len("launch:"):])
+            step["delay"] = INTENT_LAUNCH_DELAY if steps and starts_app(steps[-1]["command"], plan_commands) else 0.0
+            steps.append(step)
+    return {"steps": steps, "commands": plan_commands, "errors": errors, "unresolved": unresolved}
+
+
+def is_compound(plan, direct_command=None):
+    """
+    True when the plan needs more than the single command/app launch /voice/ws already
+    handles: several steps, a step it can't run as heard (number keys, synonyms like
+    "louder"), or an error other than not understanding the utterance. `direct_command`
+    is the commands key /voice/ws would run for the whole utterance.
+    """
+    steps = plan["steps"]
+    if len(steps) > 1:
+        return True
+    if steps:
+        command = steps[0]["command"]
+        return command != direct_command and not command.startswith("launch:")
+    return len(plan["errors"]) > len(plan["unresolved"])
@@ -0,0 +1,316 @@
+import re
+import time
+import struct
+import asyncio
+import subprocess
+from collections import deque
+
+
+# Entries kept per device for backlogs and launch error slices
+LOGCAT_BUFFER_SIZE = 5000
+# Entries logcat replays when the reader (re)starts
+LOGCAT_BACKLOG = 500
+# Entries a slow subscriber may fall behind before lines are dropped for it
+SUBSCRIBER_QUEUE_SIZE = 1000
+LOGCAT_RESTART_DELAY = 2
+LOGCAT_READ_SIZE = 64 * 1024
+
+PRIORITIES = {2: "V", 3: "D", 4: "I", 5: "W", 6: "E", 7: "F", 8: "S"}
+PRIORITY_LEVELS = {letter: level for level, letter in PRIORITIES.items()}
+
+# v1 entries have no header size field and a 20 byte header
+_V1_HEADER_SIZE = 20
+_ENTRY_HEAD = struct.Struct("<HH")
+_ENTRY_FIELDS = struct.Struct("<iIII")
+# ActivityManager announces new processes, which keeps package -> pid current
+_START_PROC = re.compile(r"Start proc (\d+):([\w.]+)")
+
+
+def parse_entries(buffer):
+    """
+    Parse as many complete `logcat -B` entries as the buffer holds.
+    Returns (entries, bytes consumed); a trailing partial entry is left for the next read.
+    """
+    entries = []
+    offset = 0
+    while len(buffer) - offset >= _ENTRY_HEAD.size:
+        payload_size, header_size = _ENTRY_HEAD.unpack_from(buffer, offset)
+        if header_size == 0:
+            header_size = _V1_HEADER_SIZE
+        if header_size < _V1_HEADER_SIZE or header_size > 128:
+            raise ValueError(f"Corrupt logcat stream (header size {header_size}).")
+        end = offset + header_size + payload_size
+        if end > len(buffer):
+            break
+        pid, tid, sec, nsec = _ENTRY_FIELDS.unpack_from(buffer, offset + _ENTRY_HEAD.size)
+        uid = None
+        if header_size >= 28:
+            uid = struct.unpack_from("<I", buffer, offset + 24)[0]
+        payload = bytes(buffer[offset + header_size:end])
+        offset = end
+        if not payload:
+            continue
+        tag, _, message = payload[1:].partition(b"\0")
+        entries.append({
+            "time": sec + nsec / 1e9,
+            "received": time.time(),
+            "pid": pid,
+            "tid": tid,
+            "uid": uid,
+            "priority": PRIORITIES.get(payload[0], "?"),
+            "tag": tag.decode(errors="replace"),
+            "message": message.rstrip(b"\0").decode(errors="replace").rstrip()
+        })
+    return entries, offset
+
+
+class LogFilter:
+    """
+    Server-side filter for a subscriber. Empty criteria match everything;
+    `priority` is a minimum ("W" passes W, E and F).
+    """
+
+    def __init__(self, tags=None, priority=None, pids=None, packages=None):
+        self.tags = set(tags or [])
+        self.min_level = PRIORITY_LEVELS.get((priority or "V").upper()[:1], 2)
+        self.pids = set(pids or [])
+        self.packages = set(packages or [])
+
+    @classmethod
+    def from_params(cls, tag=None, priority=None, pid=None, package=None):
+        """Build a filter from comma separated query parameters."""
+        split = lambda value: [item.strip() for item in (value or "").split(",") if item.strip()]
+        return cls(
+            tags=split(tag),
+            priority=priority,
+            pids=[int(item) for item in split(pid) if item.isdigit()],
+            packages=split(package)
+        )
+
+    def matches(self, entry, package_pids):
+        if PRIORITY_LEVELS.get(entry["priority"], 2) < self.min_level:
+            return False
+        if self.tags and entry["tag"] not in self.tags:
+            return False
+        if self.pids or self.packages:
+            pids = set(self.pids)
+            for package in self.packages:
+                pids |= package_pids.get(package, set())
+            if entry["pid"] not in pids:
+                return False
+        return True
+
+
+class Subscription:
+    def __init__(self, log_filter, reader=None):
+        self.filter = log_filter
+        self.reader = reader
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = 0
+
+    def offer(self, entry):
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def close(self):
+        if self.reader:
+            self.reader.unsubscribe(self)
+
+
+class StreamedSubscription(Subscription):
+    """
+    Subscription fed by a stream from elsewhere, e.g. the device owner's reader.
+    `stream(on_entry)` is awaited until close(); if it fails, an {"error": ...}
+    entry is queued so the client hears about it.
+    """
+
+    def __init__(self, stream):
+        super().__init__(None)
+        self.task = asyncio.create_task(self._run(stream))
+
+    async def _run(self, stream):
+        async def on_entry(entry):
+            self.offer(entry)
+
+        try:
+            await stream(on_entry)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.offer({"error": str(e)})
+
+    def close(self):
+        self.task.cancel()
+
+
+class DeviceLogcat:
+    """
+    One shared `logcat -B` reader for a device, feeding a fixed-size ring buffer
+    and the filtered queues of every subscriber.
+    """
+
+    def __init__(self, device=None, adb=("adb",)):
+        self.device = device
+        self.adb = list(adb) + (["-s", device] if device else [])
+        self.buffer = deque(maxlen=LOGCAT_BUFFER_SIZE)
+        self.subscribers = set()
+        self.package_pids = {}  # package -> set of pids
+        self.task = None
+        self.process = None
+        # Device time of the newest entry and the entries seen at that instant,
+        # so a restarted reader resumes there instead of replaying the backlog
+        self.last_time = None
+        self._last_keys = set()
+        self._catching_up = False
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if not self.running:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self._read()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Logcat reader for {self.device} failed: {e}")
+            await asyncio.sleep(LOGCAT_RESTART_DELAY)
+
+    def _since(self):
+        """`-T` argument: the backlog on the first start, the last seen entry's time on restarts."""
+        if self.last_time is None:
+            return str(LOGCAT_BACKLOG)
+        # Rounded down, the entries replayed up to last_time are skipped by _is_new
+        sec = int(self.last_time)
+        return f"{sec}.{int((self.last_time - sec) * 1e6):06d}"
+
+    def _is_new(self, entry):
+        key = (entry["pid"], entry["tid"], entry["tag"], entry["message"])
+        if self._catching_up:
+            if entry["time"] < self.last_time or (entry["time"] == self.last_time and key in self._last_keys):
+                return False
+            self._catching_up = False
+        if self.last_time is None or entry["time"] > self.last_time:
+            self.last_time = entry["time"]
+            self._last_keys = {key}
+        elif entry["time"] == self.last_time:
+            self._last_keys.add(key)
+        return True
+
+    async def _read(self):
+        self._catching_up = self.last_time is not None
+        # exec-out keeps the binary stream clean of pty line ending translation
+        self.process = await asyncio.create_subprocess_exec(
+            *self.adb, "exec-out", "logcat", "-B", "-T", self._since(),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        pending = bytearray()
+        try:
+            while True:
+                chunk = await self.process.stdout.read(LOGCAT_READ_SIZE)
+                if not chunk:
+                    break
+                pending += chunk
+                entries, consumed = parse_entries(pending)
+                del pending[:consumed]
+                for entry in entries:
+                    if self._is_new(entry):
+                        self._dispatch(entry)
+        finally:
+            if self.process.returncode is None:
+                self.process.kill()
+                await self.process.wait()
+
+    def _dispatch(self, entry):
+        if entry["tag"] in ("ActivityManager", "ActivityTaskManager"):
+            match = _START_PROC.search(entry["message"])
+            if match:
+                self.package_pids.setdefault(match.group(2), set()).add(int(match.group(1)))
+        self.buffer.append(entry)
+        for subscription in self.subscribers:
+            if subscription.filter.matches(entry, self.package_pids):
+                subscription.offer(entry)
+
+    def _pidof(self, package):
+        try:
+            result = subprocess.run(self.adb + ["shell", "pidof", package], capture_output=True, text=True, timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            return set()
+        return {int(pid) for pid in result.stdout.split() if pid.isdigit()}
+
+    async def resolve_packages(self, packages):
+        """Seed package -> pid for processes that started before the reader saw them."""
+        for package in packages:
+            if package not in self.package_pids:
+                pids = await asyncio.to_thread(self._pidof, package)
+                self.package_pids.setdefault(package, set()).update(pids)
+
+    async def subscribe(self, log_filter, backlog=0):
+        """
+        Register a subscriber; up to `backlog` matching buffered entries are queued first.
+        """
+        await self.resolve_packages(log_filter.packages)
+        subscription = Subscription(log_filter, self)
+        if backlog:
+            matching = [entry for entry in self.buffer if log_filter.matches(entry, self.package_pids)]
+            for entry in matching[-backlog:]:
+                subscription.offer(entry)
+        self.subscribers.add(subscription)
+        self.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def slice(self, package, since, limit=50):
+        """
+        Buffered entries about a package since a host timestamp: lines from its
+        processes, plus any line that mentions it (ActivityManager, AndroidRuntime...).
+        """
+        pids = self.package_pids.get(package, set())
+        matching = [
+            entry for entry in self.buffer
+            if entry["received"] >= since and (entry["pid"] in pids or package in entry["message"])
+        ]
+        return matching[-limit:]
+
+
+class LogcatManager:
+    """Keeps one DeviceLogcat per device."""
+
+    def __init__(self, adb=("adb",)):
+        self.adb = adb
+        self.readers = {}
+
+    def get(self, device):
+        if device not in self.readers:
+            self.readers[device] = DeviceLogcat(device, self.adb)
+        return self.readers[device]
+
+    def start(self, device):
+        reader = self.get(device)
+        reader.start()
+        return reader
+
+    async def switch(self, device):
+        """Start the reader for a newly connected device and stop the others."""
+        for other in [other for other in self.readers if other != device]:
+            await self.readers.pop(other).stop()
+        return self.start(device)
@@ -0,0 +1,229 @@
+import os
+import re
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+
+import orjson
+
+try:
+    import fcntl
+except ImportError:  # Windows, where only one worker can run anyway
+    fcntl = None
+
+
+MACRO_FILE_NAME = "macros.json"
+# Recorded pauses longer than this are shortened on replay
+MACRO_MAX_DELAY = 5.0
+# Printed by the device-side script after each step, followed by "<index>:<exit code>"
+MACRO_STEP_MARKER = "__macro_step__"
+MACRO_NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9 _-]{0,63}$")
+# Spoken verbs that can precede a macro name, e.g. "play morning news"
+MACRO_VOICE_PREFIXES = ("play", "run", "start", "do", "macro", "please")
+
+
+def normalize_macro_name(name):
+    return " ".join(name.lower().replace("_", " ").split())
+
+
+class MacroStore:
+    """
+    Named key sequences, persisted as JSON next to the app label CSV.
+    Each macro is a list of steps: {"command": <commands key>, "delay": <seconds before the step>}.
+
+    The file is shared by every uvicorn worker: reads pick up other workers' changes
+    when the file changes, and writes re-read it under a file lock before saving.
+    """
+
+    def __init__(self, working_dir):
+        self.path = os.path.join(working_dir, MACRO_FILE_NAME)
+        self.lock_path = f"{self.path}.lock"
+        self._lock = threading.Lock()
+        self._macros = {}
+        self._stamp = None
+        self._reload()
+
+    def _reload(self):
+        """Re-read the file if another worker changed it since the last read."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._macros, self._stamp = {}, None
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                self._macros = orjson.loads(f.read())
+            self._stamp = stamp
+        except Exception as e:
+            print(f"Error reading macro file: {e}")
+
+    @contextmanager
+    def _write_lock(self):
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._reload()
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(self._macros, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, self.path)
+        stat = os.stat(self.path)
+        self._stamp = (stat.st_mtime_ns, stat.st_size)
+
+    def list(self):
+        self._reload()
+        return {name: {"steps": len(steps), "duration": round(sum(step["delay"] for step in steps), 2)}
+                for name, steps in self._macros.items()}
+
+    def get(self, name):
+        self._reload()
+        return self._macros.get(normalize_macro_name(name))
+
+    def put(self, name, steps):
+        name = normalize_macro_name(name)
+        if not MACRO_NAME_PATTERN.match(name):
+            raise ValueError("Macro names may only contain letters, digits, spaces, '-' and '_'.")
+        if not steps:
+            raise ValueError("Macro has no steps.")
+        with self._write_lock():
+            self._macros[name] = steps
+            self._save()
+        return name
+
+    def delete(self, name):
+        with self._write_lock():
+            removed = self._macros.pop(normalize_macro_name(name), None)
+            if removed is not None:
+                self._save()
+        return removed is not None
+
+    def find_spoken(self, text):
+        """Resolve an utterance like "play morning news" to a stored macro name."""
+        self._reload()
+        words = normalize_macro_name(re.sub(r"[^\w\s-]", " ", text)).split()
+        while words:
+            name = " ".join(words)
+            if name in self._macros:
+                return name
+            if words[0] not in MACRO_VOICE_PREFIXES:
+                break
+            words = words[1:]
+        return None
+
+
+class MacroRecorder:
+    """
+    Collects the command keys sent over one /ws connection together with the
+    pause before each of them.
+    """
+
+    def __init__(self):
+        self.name = None
+        self.steps = []
+        self._last = None
+
+    @property
+    def active(self):
+        return self.name is not None
+
+    def start(self, name):
+        self.name = name
+        self.steps = []
+        self._last = None
+
+    def add(self, command_key):
+        now = time.monotonic()
+        delay = 0.0 if self._last is None else min(now - self._last, MACRO_MAX_DELAY)
+        self._last = now
+        self.steps.append({"command": command_key, "delay": round(delay, 2)})
+
+    def stop(self):
+        name, steps = self.name, self.steps
+        self.name = None
+        self.steps = []
+        self._last = None
+        return name, steps
+
+
+def device_command(command):
+    """Strip the host-side `adb shell` prefix so a command can run inside a device script."""
+    if not command.startswith("adb shell "):
+        raise ValueError(f"Command can't run on the device: {command}")
+    return command[len("adb shell "):]
+
+
+def compile_macro(steps, commands):
+    """
+    Compile macro steps into one device-side shell script. Every step prints a
+    marker with its index and exit code so results can be streamed back.
+    """
+    lines = []
+    for index, step in enumerate(steps):
+        if step["command"] not in commands:
+            raise ValueError(f"Unknown command in macro: {step['command']}")
+        delay = min(max(float(step.get("delay", 0)), 0.0), MACRO_MAX_DELAY)
+        if delay > 0:
+            lines.append(f"sleep {delay:.2f}")
+        lines.append(f"{device_command(commands[step['command']])}; echo {MACRO_STEP_MARKER}{index}:$?")
+    return "; ".join(lines)
+
+
+async def play_macro(steps, commands, adb=("adb",)):
+    """
+    Replay a macro in a single adb round trip, yielding one result per step as
+    soon as the device reports it. `adb` is the host-side command prefix, e.g.
+    ("adb", "-s", "192.168.1.100:5555") to target one device.
+    """
+    script = compile_macro(steps, commands)
+    process = await asyncio.create_subprocess_exec(
+        *adb, "shell", script,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    started = time.monotonic()
+    output = []
+    reported = 0
+    timeout = sum(float(step.get("delay", 0)) for step in steps) + 5 * len(steps)
+    try:
+        while True:
+            line = await asyncio.wait_for(process.stdout.readline(), timeout=timeout)
+            if not line:
+                break
+            line = line.decode(errors="ignore").strip()
+            if not line.startswith(MACRO_STEP_MARKER):
+                if line:
+                    output.append(line)
+                continue
+            index, exit_code = line[len(MACRO_STEP_MARKER):].split(":", 1)
+            index, exit_code = int(index), int(exit_code)
+            reported = index + 1
+            yield {
+                "step": index,
+                "command": steps[index]["command"],
+                "status_code": 200 if exit_code == 0 else 500,
+                "exit_code": exit_code,
+                "output": "\n".join(output),
+                "elapsed": round(time.monotonic() - started, 2)
+            }
+            output = []
+        await process.wait()
+        if process.returncode != 0 and reported < len(steps):
+            stderr = (await process.stderr.read()).decode(errors="ignore").strip()
+            raise Exception(f"Macro stopped after {reported} of {len(steps)} steps: {stderr or 'Unknown error occurred'}")
+    except asyncio.TimeoutError:
+        raise Exception("ADB command timed out.")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
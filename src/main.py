@@ -1,9 +1,10 @@
 import subprocess
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Response
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Response, Request
 import asyncio
 import re
+import time
 import orjson
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import socket
 import aiohttp
 import xml.etree.ElementTree as ET
@@ -12,11 +13,22 @@ import io
 import speech_recognition as sr
 from pydub import AudioSegment
 from difflib import SequenceMatcher
-from concurrent.futures import ThreadPoolExecutor
 import csv
+import base64
+import hashlib
+from app_icons import IconCache, ICON_SIZES, ICON_KINDS, DEFAULT_ICON_SIZE
+from app_catalog import process_app_ids, pull_app_drawables
+from package_snapshot import PackageSnapshot, fetch_package_listing, refresh_snapshot, watch_packages
+from macros import MacroStore, MacroRecorder, play_macro
+from intents import compile_intent, is_compound
+from app_index import AppNameIndex
+from broker import BrokerError, DeviceRouter, InProcessBroker, SocketBroker, parse_owners
+from device_owner import DeviceOwner
+from logcat import LogcatManager, LogFilter, StreamedSubscription
 
 
 adb_connected = False
+current_device = None
 app = FastAPI()
 
 
@@ -32,6 +44,32 @@ else:
 WORKING_DIR = os.path.abspath(directory_name)  # Use absolute path for clarity
 CSV_FILE_PATH = os.path.join(WORKING_DIR, "app_labels.csv")
 
+# Content-addressed icon cache, filled while the app catalog is indexed
+icon_cache = IconCache(WORKING_DIR)
+
+# Recorded key sequences, replayed as a single device-side script
+macro_store = MacroStore(WORKING_DIR)
+
+# One shared logcat reader per device, see /logcat/ws
+logcat_manager = LogcatManager()
+# Wait for the tail of a failed launch to reach the logcat buffer
+LAUNCH_LOG_SETTLE = 0.5
+
+# Multi-worker deployments: device I/O is routed to device-owner workers (see device_owner.py),
+# picked per device by consistent hashing. Set DEVICE_OWNERS to
+# "owner-1=tcp://127.0.0.1:7001,owner-2=unix:///tmp/owner-2.sock", or to "inprocess" to run a
+# single owner inside this worker. Left unset, this process talks to adb directly as before.
+DEVICE_OWNERS = os.environ.get("DEVICE_OWNERS", "").strip()
+device_router = None
+if DEVICE_OWNERS == "inprocess":
+    in_process_broker = InProcessBroker()
+    in_process_broker.register("local", DeviceOwner("local", working_dir=WORKING_DIR).handle)
+    device_router = DeviceRouter(in_process_broker)
+elif DEVICE_OWNERS:
+    device_router = DeviceRouter(SocketBroker(parse_owners(DEVICE_OWNERS), token=os.environ.get("BROKER_TOKEN")))
+# With owners, the last connected device is shared by every worker through this file
+LAST_DEVICE_FILE = os.path.join(WORKING_DIR, "last_device.txt")
+
 
 
 MSEARCH_PAYLOAD = (
@@ -195,13 +233,14 @@ def connect_adb(device_ip: str):
     """
     Connects to a device via ADB using the provided IP address with retries and polling.
     """
-    global adb_connected
+    global adb_connected, current_device
 
     try:
         # Check if already connected
         devices_result = run_command("adb devices")
         if f"{device_ip}\tdevice" in devices_result["output"]:
             adb_connected = True
+            current_device = device_ip
             return {"status_code": 200, "message": "ADB is already connected to the device."}
 
         # Restart ADB server to ensure proper connection
@@ -217,6 +256,7 @@ def connect_adb(device_ip: str):
             devices_result = run_command("adb devices")
             if f"{device_ip}\tdevice" in devices_result["output"]:
                 adb_connected = True
+                current_device = device_ip
                 return {"status_code": 200, "message": "ADB connection successful."}
             elif f"{device_ip}\tunauthorized" in devices_result["output"]:
                 adb_connected = False
@@ -233,101 +273,153 @@ def connect_adb(device_ip: str):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
-# Function to execute a shell command and return output
-def run_command_for_system_Apps(command):
-    try:
-        result = subprocess.run(command, shell=True, text=True, capture_output=True)
-        if result.returncode == 0:
-            return result.stdout.strip()
-        else:
-            return None
-    except Exception as e:
-        return None
+# adb command prefix pinned to one device, for the catalog scan in app_catalog.py
+def device_adb(device=None):
+    return ["adb", "-s", device] if device else ["adb"]
 
 
-# Function to get the application label directly using dumpsys
-def get_application_labels(app_id):
-    command = f"adb shell dumpsys package {app_id} | grep 'ApplicationLabel'"
-    output = run_command_for_system_Apps(command)
-    if output:
-        return output.split(":")[-1].strip()
-    return "Unknown"
-
-
-# Function to process a single app ID
-def process_app_ids(app_id):
-    app_label = get_application_labels(app_id)
-    if app_label != "Unknown":
-        return {"app_id": app_id, "app_name": app_label}
+async def device_packages(device):
+    """
+    All installed packages ({name: version code}) and the third-party subset of a
+    device, in one adb round trip here or on the device's owner.
+    """
+    if device_router:
+        response = await device_router.call(device, "packages")
+        if response["status_code"] != 200:
+            raise Exception(response["error_message"])
+        return response["packages"], set(response["third_party"])
+    return await asyncio.to_thread(fetch_package_listing, device)
+
+
+async def device_labels(device, app_ids):
+    """Label apps from dumpsys, or from their APK as a fallback, here or on the device's owner."""
+    if device_router:
+        response = await device_router.call(device, "labels", app_ids=app_ids)
+        if response["status_code"] != 200:
+            raise Exception(response["error_message"])
+        return response["labels"]
+    return await asyncio.to_thread(
+        lambda: [process_app_ids(app_id, WORKING_DIR, device_adb(device)) for app_id in app_ids]
+    )
+
+
+async def device_drawables(device, app_id):
+    """
+    An app's icon/banner ({kind: image bytes}) pulled here or on the device's owner,
+    or None if its APK couldn't be pulled.
+    """
+    if device_router:
+        response = await device_router.call(device, "drawables", app_id=app_id)
+        if response["status_code"] != 200:
+            raise Exception(response["error_message"])
+        if response["drawables"] is None:
+            return None
+        return {kind: base64.b64decode(data) for kind, data in response["drawables"].items()}
+    return await asyncio.to_thread(pull_app_drawables, app_id, WORKING_DIR, device_adb(device))
 
-    command = f"adb shell pm path {app_id}"
-    apk_paths = run_command_for_system_Apps(command)
-    if not apk_paths:
-        return {"app_id": app_id, "app_name": "Not Found"}
 
-    apk_path = apk_paths.splitlines()[0].split(":")[1]
-    apk_file = os.path.join(WORKING_DIR, f"{app_id}.apk")
-    pull_command = f"adb pull {apk_path} {apk_file}"
-    if not run_command_for_system_Apps(pull_command):
-        return {"app_id": app_id, "app_name": "Pull Failed"}
+# Pull an app's APK and store its launcher icon/banner in the icon cache
+async def index_app_icon(app_id, device):
+    drawables = await device_drawables(device, app_id)
+    if drawables is None:
+        return {}
+    return await asyncio.to_thread(icon_cache.store, app_id, drawables)
 
-    aapt_command = f"aapt dump badging {apk_file} | grep 'application-label'"
-    aapt_output = run_command_for_system_Apps(aapt_command)
-    if aapt_output:
-        label = aapt_output.split(":")[-1].strip().strip("'")
-        return {"app_id": app_id, "app_name": label}
 
-    return {"app_id": app_id, "app_name": "Unknown"}
+# Background task for indexing icons of third-party apps that weren't tried yet
+async def index_app_icons(device, third_party_app_ids=None):
+    if third_party_app_ids is None:
+        try:
+            _, third_party_app_ids = await device_packages(device)
+        except Exception as e:
+            print(f"Skipping icon indexing: {e}")
+            return
+    missing = [app_id for app_id in sorted(third_party_app_ids) if not icon_cache.was_indexed(app_id)]
+    for app_id in missing:
+        try:
+            await index_app_icon(app_id, device)
+        except Exception as e:
+            print(f"Icon extraction failed for {app_id}: {e}")
 
 
-# Function to fetch the list of installed third-party packages
-def fetch_all_installed_packages():
+# Background task for fetching installed apps
+async def fetch_and_store_apps(device):
     try:
-        result = subprocess.run(
-            ["adb", "shell", "pm", "list", "packages"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=10,
-            text=True
-        )
-        if result.returncode != 0:
-            raise Exception(f"ADB error: {result.stderr.strip()}")
-
-        packages = result.stdout.splitlines()
-        package_list = [pkg.split(":")[1] for pkg in packages if pkg.startswith("package:")]
-
-        return package_list
-    except subprocess.TimeoutExpired:
-        raise Exception("ADB command timed out.")
+        packages, third_party = await device_packages(device)
     except Exception as e:
-        raise Exception(str(e))
-
-
-# Background task for fetching installed apps
-async def fetch_and_store_apps():
-    package_list = fetch_all_installed_packages()
+        print(f"Skipping app indexing: {e}")
+        return
     existing_apps = {}
     if os.path.exists(CSV_FILE_PATH):
         with open(CSV_FILE_PATH, "r") as csvfile:
             reader = csv.DictReader(csvfile)
             existing_apps = {row["app_id"]: row["app_name"] for row in reader}
 
-    new_app_ids = [app_id for app_id in package_list if app_id not in existing_apps]
+    new_app_ids = [app_id for app_id in packages if app_id not in existing_apps]
 
     if new_app_ids:
         os.makedirs(WORKING_DIR, exist_ok=True)
-        with ThreadPoolExecutor() as executor:
-            loop = asyncio.get_event_loop()
-            new_results = await loop.run_in_executor(executor, lambda: list(map(process_app_ids, new_app_ids)))
+        store_app_labels(await device_labels(device, new_app_ids))
+
+    await index_app_icons(device, third_party)
+
 
-        with open(CSV_FILE_PATH, "a", newline="") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=["app_id", "app_name"])
-            if not existing_apps:
-                writer.writeheader()
-            writer.writerows(new_results)
+# Append newly labeled apps to the CSV and the in-memory catalog
+def store_app_labels(new_results):
+    write_header = not os.path.exists(CSV_FILE_PATH) or os.path.getsize(CSV_FILE_PATH) == 0
+    with open(CSV_FILE_PATH, "a", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=["app_id", "app_name"])
+        if write_header:
+            writer.writeheader()
+        writer.writerows(new_results)
 
-        for result in new_results:
-            existing_apps[result["app_id"]] = result["app_name"]
+    for result in new_results:
+        if result["app_id"] not in app_labels:
+            app_data.append({"app_id": result["app_id"], "app_name": result["app_name"]})
+        app_labels[result["app_id"]] = result["app_name"]
+        app_index.add_app(result["app_id"], result["app_name"])
+
+
+# Per-device installed package snapshots, kept current by a background watcher
+package_snapshots = {}
+package_watchers = {}
+
+
+async def on_packages_changed(snapshot, changes):
+    """
+    Label newly installed apps and refresh icons of replaced ones.
+    """
+    print(f"Package changes on {snapshot.device}: {changes}")
+    new_app_ids = [app_id for app_id in changes["installed"] if app_id not in app_labels]
+    if new_app_ids:
+        store_app_labels(await device_labels(snapshot.device, new_app_ids))
+
+    for app_id in changes["installed"] + changes["replaced"]:
+        if app_id in snapshot.third_party:
+            try:
+                await index_app_icon(app_id, snapshot.device)
+            except Exception as e:
+                print(f"Icon extraction failed for {app_id}: {e}")
+
+
+def start_package_watcher(device):
+    """
+    Start (or restart) the package watcher for a device, stopping the watchers of
+    previously connected devices.
+    """
+    for other in list(package_watchers):
+        if other != device:
+            package_watchers.pop(other).cancel()
+            package_snapshots.pop(other, None)
+    if device not in package_snapshots:
+        package_snapshots[device] = PackageSnapshot(device)
+    watcher = package_watchers.get(device)
+    if watcher and not watcher.done():
+        return package_snapshots[device]
+    package_watchers[device] = asyncio.create_task(
+        watch_packages(package_snapshots[device], on_packages_changed, fetch=device_packages)
+    )
+    return package_snapshots[device]
 
 
 # API Endpoint for device connection
@@ -337,14 +429,33 @@ async def adb_connects(device_ip: str):
     API endpoint to connect to a device via ADB and fetch installed apps in the background.
     """
     global adb_connected
+    if device_router:
+        # The owning worker holds the adb channel, this worker stays stateless
+        try:
+            connection_response = await device_router.call(device_ip, "connect")
+        except BrokerError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        if connection_response["status_code"] == 200:
+            remember_device(device_ip)
+            start_package_watcher(device_ip)
+            # Labels and icons are read on the owner, stored here in the shared app data
+            asyncio.create_task(fetch_and_store_apps(device_ip))
+        return JSONResponse(status_code=connection_response["status_code"], content=connection_response)
+
     try:
         # Attempt to connect to the device
         connection_response = connect_adb(device_ip)
+        if connection_response["status_code"] == 200:
+            start_package_watcher(device_ip)
+            await logcat_manager.switch(device_ip)
         if os.path.exists(CSV_FILE_PATH):
             with open(CSV_FILE_PATH, "r") as csvfile:
                 reader = csv.reader(csvfile)
                 # Skip header and check if there's at least one row of data
                 if any(row for index, row in enumerate(reader) if index > 0):
+                    # Labels are cached already, only pick up icons for newly installed apps
+                    if connection_response["status_code"] == 200:
+                        asyncio.create_task(index_app_icons(device_ip))
                     return JSONResponse(
                         status_code=200,
                         content={"status_code": 200, "message": "ADB connection successful"}
@@ -352,7 +463,7 @@ async def adb_connects(device_ip: str):
 
         # If connection is successful, start the background task
         if connection_response["status_code"] == 200:
-            asyncio.create_task(fetch_and_store_apps())
+            asyncio.create_task(fetch_and_store_apps(device_ip))
 
         # Return the connection response
         return JSONResponse(
@@ -383,14 +494,166 @@ async def send_number(number: str):
     return run_adb_command(command)
 
 
+def remember_device(device):
+    """Make a routed connect the default device for requests without ?device= on every worker."""
+    global current_device
+    current_device = device
+    tmp_path = f"{LAST_DEVICE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(device)
+    os.replace(tmp_path, LAST_DEVICE_FILE)
+
+
+def selected_device(device=None):
+    """The device a request targets: its ?device=, else the last connected one."""
+    if device or not device_router:
+        return device or current_device
+    try:
+        with open(LAST_DEVICE_FILE, "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+async def device_is_connected(device):
+    if device_router:
+        if not device:
+            return False
+        state = await device_router.call(device, "state")
+        return state["connected"]
+    return adb_connected
+
+
+async def device_run(device, command):
+    """
+    Run one entry of `commands`, here or on the device's owner.
+    Returns {"status_code": 200, ...} or an error dict with "error_message".
+    """
+    if device_router:
+        return await device_router.call(device, "run", command=command)
+    return await asyncio.to_thread(run_adb_command, command)
+
+
+async def device_launch(device, app_id):
+    """Open an app, here or on the device's owner. Raises on failure like open_apps."""
+    if device_router:
+        response = await device_router.call(device, "launch", app_id=app_id)
+        if response["status_code"] != 200:
+            raise Exception(response["error_message"])
+        return response["message"]
+    return await asyncio.to_thread(open_apps, app_id)
+
+
+async def device_play(device, steps, plan_commands, on_step):
+    """
+    Play compiled steps as one device-side script, here or on the device's owner,
+    calling `on_step` with each step result as it arrives.
+    """
+    if device_router:
+        needed = {step["command"]: plan_commands[step["command"]] for step in steps if step["command"] in plan_commands}
+        results = await device_router.call(device, "play", on_event=on_step, steps=steps, commands=needed)
+        if not isinstance(results, list):
+            raise Exception(results.get("error_message", "Unknown error occurred"))
+        return results
+    results = []
+    async for result in play_macro(steps, plan_commands):
+        results.append(result)
+        await on_step(result)
+    return results
+
+
+async def run_macro(name, send, device=None):
+    """
+    Replay a stored macro in one adb round trip, passing each step result to `send`.
+    """
+    steps = macro_store.get(name)
+    if steps is None:
+        raise Exception(f"Macro '{name}' not found.")
+
+    async def on_step(result):
+        await send({"macro": name, "step": result})
+
+    results = await device_play(device, steps, commands, on_step)
+    failed = [result for result in results if result["status_code"] != 200]
+    return {
+        "status_code": 500 if failed else 200,
+        "macro": name,
+        "steps": results,
+        "message": f"Macro '{name}' finished with {len(failed)} failed step(s)." if failed else f"Macro '{name}' played successfully."
+    }
+
+
+async def handle_macro_message(websocket, message, recorder, device=None):
+    """
+    Macro control messages on /ws:
+        macro:record:<name>   start recording the following commands
+        macro:stop            save the recording
+        macro:cancel          drop the recording
+        macro:play:<name>     replay a macro, streaming one message per step
+    """
+    async def send(payload):
+        await websocket.send_text(orjson.dumps(payload).decode())
+
+    action, _, name = message[len("macro:"):].partition(":")
+    if action == "record":
+        if not name.strip():
+            return {"status_code": 400, "error_message": "Macro name is required."}
+        recorder.start(name.strip())
+        return {"status_code": 200, "message": f"Recording macro '{recorder.name}'."}
+    if action == "stop":
+        if not recorder.active:
+            return {"status_code": 400, "error_message": "Not recording a macro."}
+        name, steps = recorder.stop()
+        try:
+            name = macro_store.put(name, steps)
+        except ValueError as e:
+            return {"status_code": 400, "error_message": str(e)}
+        return {"status_code": 200, "message": f"Macro '{name}' saved.", "steps": steps}
+    if action == "cancel":
+        recorder.stop()
+        return {"status_code": 200, "message": "Macro recording cancelled."}
+    if action == "play":
+        if recorder.active:
+            return {"status_code": 400, "error_message": "Stop recording before playing a macro."}
+        try:
+            return await run_macro(name.strip(), send, device)
+        except Exception as e:
+            return {"status_code": 500, "error_message": str(e)}
+    return {"status_code": 400, "error_message": "Invalid macro command."}
+
+
+@app.get("/macros")
+async def list_macros():
+    """
+    List the stored macros with their step count and total duration in seconds.
+    """
+    return {"status": 200, "macros": macro_store.list()}
+
+
+@app.delete("/macros/{name}")
+async def delete_macro(name: str):
+    if not macro_store.delete(name):
+        raise HTTPException(status_code=404, detail=f"Macro '{name}' not found.")
+    return {"status": 200, "message": f"Macro '{name}' deleted."}
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     global adb_connected
     await websocket.accept()
-    if not adb_connected:
+    # Clients pick a TV with ?device=ip:port, defaulting to the last connected one
+    device = selected_device(websocket.query_params.get("device"))
+    try:
+        connected = await device_is_connected(device)
+    except BrokerError as e:
+        # Owner unreachable: answer like the rest of the endpoint instead of closing with 1011
+        await websocket.send_text(orjson.dumps({"error": str(e)}).decode())
+        return
+    if not connected:
         await websocket.send_text(orjson.dumps({"error": "ADB not connected. Connect first using /adb/connect."}).decode())
         return
 
+    recorder = MacroRecorder()
     try:
         await websocket.send_text("ADB WebSocket connection established. Send a command to execute.")
         while True:
@@ -398,8 +661,12 @@ async def websocket_endpoint(websocket: WebSocket):
                 raw_command_key = await websocket.receive_text()
                 command_key = re.sub(r"(?:keypad:)?", "", raw_command_key.strip())
                 print('rohit',command_key)
-                if command_key in commands:
-                    response = await asyncio.to_thread(run_adb_command, commands[command_key])
+                if command_key.startswith("macro:"):
+                    response = await handle_macro_message(websocket, command_key, recorder, device)
+                elif command_key in commands:
+                    response = await device_run(device, commands[command_key])
+                    if recorder.active:
+                        recorder.add(command_key)
                 else:
                     response = {"status_code": 400, "error_message": "Invalid command."}
                 await websocket.send_text(orjson.dumps(response).decode())
@@ -413,68 +680,89 @@ async def websocket_endpoint(websocket: WebSocket):
 
 
 
-def fetch_third_party_packages():
+@app.get("/filter-third-party-apps")
+async def filter_third_party_apps(request: Request, device: str = None):
     """
-    Fetch the list of third-party app IDs using adb.
+    Filter third-party apps based on app_id from the in-memory package snapshot and app labels.
     """
     try:
-        result = subprocess.run(
-            ["adb", "shell", "pm", "list", "packages", "-3"],  # Third-party apps
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=10,
-            text=True
-        )
+        # Step 1: Get third-party app IDs from the snapshot, only hitting adb on first use
+        device = selected_device(device)
+        if not device:
+            raise Exception("ADB not connected. Connect first.")
+        snapshot = start_package_watcher(device)
+        if not snapshot.loaded:
+            await refresh_snapshot(snapshot, fetch=device_packages)
+
+        # Step 2: Labels are loaded from the CSV at startup and kept current by the indexer
+        if not app_labels:
+            raise Exception(f'''Fetching installed apps from the device. This may take some time as it is only required during the first connection. Please keep the app open and avoid shutting down your system until the process completes...''')
 
-        if result.returncode != 0:
-            raise Exception(f"ADB error: {result.stderr.strip()}")
+        # Step 3: Filter labeled apps that match third-party app IDs
+        filtered_apps = [
+            {"app_id": app_id, "app_name": app_labels[app_id], "icon_url": app_icon_url(app_id)}
+            for app_id in snapshot.third_party_packages()
+            if app_id in app_labels
+        ]
 
-        # Parse the output to extract package names
-        packages = result.stdout.splitlines()
-        package_list = [pkg.split(":")[1] for pkg in packages if pkg.startswith("package:")]
+        # Step 4: Return the filtered apps. The ETag is a hash of the body, so it stays
+        # valid across restarts and changes with any label or icon update
+        body = orjson.dumps({
+            "status": 200,
+            "message": "Filtered third-party apps successfully.",
+            "filtered_count": len(filtered_apps),
+            "apps": filtered_apps
+        })
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
-        return package_list
-    except subprocess.TimeoutExpired:
-        raise Exception("ADB command timed out.")
     except Exception as e:
-        raise Exception(str(e))
+        raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/filter-third-party-apps")
-async def filter_third_party_apps():
+
+def app_icon_url(app_id, kind="icon"):
     """
-    Filter third-party apps based on app_id from CSV.
+    Versioned icon URL for the UI, or None if no icon was extracted yet.
+    The hash in the query string lets the browser cache the response forever.
     """
-    try:
-        # Step 1: Fetch third-party app IDs from adb
-        third_party_app_ids = fetch_third_party_packages()
+    icon_hash = icon_cache.get_hash(app_id, kind)
+    if not icon_hash:
+        return None
+    return f"/apps/{app_id}/icon?kind={kind}&v={icon_hash[:16]}"
 
-        # Step 2: Load system app data from the CSV file
-        if not os.path.exists(CSV_FILE_PATH):
-            raise Exception(f'''Fetching installed apps from the device. This may take some time as it is only required during the first connection. Please keep the app open and avoid shutting down your system until the process completes...''')
 
+@app.get("/apps/{app_id}/icon")
+async def app_icon(app_id: str, request: Request, size: int = DEFAULT_ICON_SIZE, kind: str = "icon", v: str = None):
+    """
+    Serve an app icon/banner from the icon cache, no device I/O involved.
+    """
+    if size not in ICON_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unsupported size. Use one of {list(ICON_SIZES)}.")
+    if kind not in ICON_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unsupported kind. Use one of {list(ICON_KINDS)}.")
 
-        with open(CSV_FILE_PATH, "r") as csvfile:
-            reader = csv.DictReader(csvfile)
-            csv_data = {row["app_id"]: row["app_name"] for row in reader}
+    icon_hash = icon_cache.get_hash(app_id, kind)
+    if not icon_hash:
+        raise HTTPException(status_code=404, detail=f"No {kind} available for {app_id}.")
 
-        # Step 3: Filter apps in CSV that match third-party app IDs
-        filtered_apps = [
-            {"app_id": app_id, "app_name": csv_data[app_id]}
-            for app_id in third_party_app_ids
-            if app_id in csv_data
-        ]
+    etag = f'"{icon_hash}-{size}"'
+    if v and icon_hash.startswith(v):
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=86400"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
 
-        # Step 4: Return the filtered apps
-        return {
-            "status": 200,
-            "message": "Filtered third-party apps successfully.",
-            "filtered_count": len(filtered_apps),
-            "apps": filtered_apps
-        }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    data = await asyncio.to_thread(icon_cache.read, icon_hash, size)
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"No {kind} available for {app_id}.")
+    return Response(content=data, media_type="image/png", headers=headers)
 
 
 
@@ -521,13 +809,17 @@ def open_app(app_id):
 
 
 @app.get("/open-app/{app_id}")
-async def open_app_endpoint(app_id: str):
+async def open_app_endpoint(app_id: str, device: str = None):
     """
     Endpoint to open an app on the connected Android device based on the app_id (package name).
     """
+    started = time.time()
     try:
         # Step 2: Open the app
-        launch_status = open_app(app_id)
+        if device_router:
+            launch_status = await device_launch(selected_device(device), app_id)
+        else:
+            launch_status = open_app(app_id)
 
         return {
             "status": 200,
@@ -535,6 +827,9 @@ async def open_app_endpoint(app_id: str):
             "message": launch_status
         }
     except Exception as e:
+        log_slice = await launch_log_slice(selected_device(device), app_id, started)
+        if log_slice:
+            raise HTTPException(status_code=500, detail={"error_message": str(e), "logcat": log_slice})
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -583,6 +878,11 @@ def load_app_data(csv_file="all_firetv_app_list/app_labels.csv"):
 
 # In-memory store for app data
 app_data = load_app_data()
+app_labels = {app["app_id"]: app["app_name"] for app in app_data}
+
+# Alias/phonetic index over app_data, consulted before fuzzy matching
+app_index = AppNameIndex(WORKING_DIR)
+app_index.build(app_data)
 
 # Extract meaningful keywords from the query
 def extract_keywords(query):
@@ -641,6 +941,14 @@ def string_similarity(a, b):
 # Search for app name based on similarity
 def search_app_name(query, app_data, similarity_threshold=0.7):
     search_string = extract_keywords(query)
+
+    # Most spoken names resolve by alias/spelling/phonetic lookup without scanning every app.
+    # A command word like "amazon" only goes to an app through an alias or the app's exact
+    # name; a looser token or phonetic hit must not shadow the command.
+    indexed = app_index.lookup(search_string)
+    if indexed and (search_string not in commands or indexed[0]["match"] in ("alias", "exact")):
+        return indexed
+
     results = []
 
     for app in app_data:
@@ -655,6 +963,26 @@ def search_app_name(query, app_data, similarity_threshold=0.7):
     results.sort(key=lambda x: x["similarity"], reverse=True)
     return results if results else f"No matches found for '{query}'"
 
+@app.get("/apps/aliases")
+async def list_app_aliases():
+    """
+    List user-defined and confirmed spoken aliases for apps.
+    """
+    return {"status": 200, "aliases": app_index.all_aliases()}
+
+
+@app.post("/apps/aliases")
+async def add_app_alias(alias: str, app_id: str):
+    """
+    Map a spoken name (e.g. "hot star") to an app, so voice commands resolve it directly.
+    """
+    try:
+        added = app_index.add_alias(alias, app_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": 200, "message": "Alias added." if added else "Alias already exists."}
+
+
 # Recognize speech from audio data
 async def recognize_audio(audio_data):
     try:
@@ -745,27 +1073,94 @@ def run_commands(commands):
         raise Exception(f"Error running command: {str(e)}")
 
 
+# Best app match for one clause of a voice intent
+def resolve_spoken_app(clause):
+    results = search_app_name(clause, app_data)
+    if isinstance(results, list) and results:
+        return results[0]
+    return None
+
+
+async def run_intent_plan(text, plan, send, device=None):
+    """
+    Play a compiled voice intent in one adb round trip, passing each step result to `send`.
+    """
+    expanded = [
+        {"step": index, "command": step["command"], "clause": step["clause"], "delay": step["delay"]}
+        for index, step in enumerate(plan["steps"])
+    ]
+    if plan["errors"]:
+        return {"text": text, "plan": expanded, "error": " ".join(plan["errors"])}
+
+    results = []
+
+    async def on_step(result):
+        results.append(result)
+        await send({"text": text, "step": result})
+
+    try:
+        await device_play(device, plan["steps"], plan["commands"], on_step)
+    except Exception as e:
+        return {"text": text, "plan": expanded, "steps": results, "error": str(e)}
+
+    failed = [result for result in results if result["status_code"] != 200]
+    return {
+        "text": text,
+        "plan": expanded,
+        "steps": results,
+        "message": f"{len(failed)} of {len(results)} step(s) failed." if failed else f"Executed {len(results)} step(s) successfully."
+    }
+
+
 ###for text
 
 @app.websocket("/voice/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    device = selected_device(websocket.query_params.get("device"))
     try:
         while True:
             # Receive text directly from the client
             data = await websocket.receive_json()  # Assuming the frontend sends a JSON payload
             text = data.get("text", "").strip()
 
+            # The client confirms which app was meant, teach it to the alias table
+            if text and data.get("confirm_app_id"):
+                try:
+                    app_index.add_alias(extract_keywords(text), data["confirm_app_id"])
+                    await websocket.send_json({"text": text, "message": f"'{text}' will open {data['confirm_app_id']}."})
+                except ValueError as e:
+                    await websocket.send_json({"text": text, "error": str(e)})
+                continue
+
             if not text:
                 await websocket.send_json({"error": "No text provided."})
                 continue
 
+            # Stored macros are called by name, e.g. "play morning news"
+            macro_name = macro_store.find_spoken(text)
+            if macro_name:
+                try:
+                    response = {"text": text, **(await run_macro(macro_name, websocket.send_json, device))}
+                except Exception as e:
+                    response = {"text": text, "macro": macro_name, "error": str(e)}
+                await websocket.send_json(response)
+                continue
+
+            # Counts, channel numbers and chained actions run as one batched plan
+            plan = compile_intent(text, commands, extract_keywords, resolve_spoken_app)
+            if is_compound(plan, extract_keywords(text)):
+                response = await run_intent_plan(text, plan, websocket.send_json, device)
+                await websocket.send_json(response)
+                continue
+
             # Search for the app based on the received text
             results = search_app_name(text, app_data)
             if isinstance(results, list) and results:
                 app_id = results[0]['app_id']
+                started = time.time()
                 try:
-                    play = open_apps(app_id)
+                    play = await device_launch(device, app_id)
                     response = {
                         "text": text,
                         "matches": results,
@@ -777,6 +1172,9 @@ async def websocket_endpoint(websocket: WebSocket):
                         "matches": results,
                         "error": str(e)
                     }
+                    log_slice = await launch_log_slice(device, app_id, started)
+                    if log_slice:
+                        response["logcat"] = log_slice
             else:
                 # Handle cases where no app matches are found
                 extracted_command = extract_keywords(text)
@@ -785,7 +1183,13 @@ async def websocket_endpoint(websocket: WebSocket):
 
                 if command_to_run:
                     try:
-                        run_output = run_commands(command_to_run)
+                        if device_router:
+                            run_response = await device_run(device, command_to_run)
+                            if run_response["status_code"] != 200:
+                                raise Exception(run_response["error_message"])
+                            run_output = run_response.get("output", "")
+                        else:
+                            run_output = run_commands(command_to_run)
                         response = {
                             "text": text,
                             "command": extracted_command,
@@ -813,6 +1217,112 @@ async def websocket_endpoint(websocket: WebSocket):
 
 
 
+async def launch_log_slice(device, app_id, started):
+    """
+    Logcat lines about an app since a launch attempt, attached to launch errors.
+    """
+    if device_router:
+        await asyncio.sleep(LAUNCH_LOG_SETTLE)
+        try:
+            response = await device_router.call(device, "log_slice", app_id=app_id, since=started - 1)
+        except BrokerError:
+            return []
+        return response.get("entries", [])
+    reader = logcat_manager.readers.get(device)
+    if not reader or not reader.running:
+        return []
+    await asyncio.sleep(LAUNCH_LOG_SETTLE)
+    return reader.slice(app_id, started - 1)
+
+
+async def subscribe_logcat(device, tag=None, priority=None, pid=None, package=None, backlog=0):
+    """
+    Filtered logcat subscription for a device, read here or streamed from its owner.
+    Callers read `queue` and must close() it.
+    """
+    if device_router:
+        async def stream(on_entry):
+            await device_router.call(device, "logcat", on_event=on_entry, tag=tag, priority=priority,
+                                     pid=pid, package=package, backlog=backlog)
+
+        return StreamedSubscription(stream)
+    return await logcat_manager.get(device).subscribe(LogFilter.from_params(tag, priority, pid, package), backlog=backlog)
+
+
+@app.websocket("/logcat/ws")
+async def logcat_websocket(websocket: WebSocket):
+    """
+    Stream a device's logcat, filtered on the server. Query parameters (all optional):
+    device, tag (comma separated), priority (minimum, e.g. W), pid, package, backlog.
+    """
+    await websocket.accept()
+    params = websocket.query_params
+    device = selected_device(params.get("device"))
+    try:
+        connected = await device_is_connected(device)
+    except BrokerError as e:
+        await websocket.send_json({"error": str(e)})
+        await websocket.close()
+        return
+    if not connected:
+        await websocket.send_json({"error": "ADB not connected. Connect first using /adb/connect."})
+        await websocket.close()
+        return
+
+    backlog = int(params.get("backlog", "100")) if params.get("backlog", "100").isdigit() else 100
+    subscription = await subscribe_logcat(device, params.get("tag"), params.get("priority"), params.get("pid"),
+                                          params.get("package"), backlog)
+
+    async def forward():
+        while True:
+            entry = await subscription.queue.get()
+            await websocket.send_json(entry)
+
+    # The client never has to send anything, receiving only detects the disconnect
+    sender = asyncio.create_task(forward())
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        print("Logcat WebSocket disconnected.")
+    finally:
+        sender.cancel()
+        subscription.close()
+
+
+@app.get("/logcat/stream")
+async def logcat_stream(request: Request, device: str = None, tag: str = None, priority: str = None,
+                        pid: str = None, package: str = None, backlog: int = 100):
+    """
+    Same filtered logcat stream as /logcat/ws, as Server-Sent Events.
+    """
+    device = selected_device(device)
+    try:
+        connected = await device_is_connected(device)
+    except BrokerError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if not connected:
+        raise HTTPException(status_code=500, detail="ADB not connected. Connect first.")
+
+    async def events():
+        # Subscribed here, not in the endpoint, so a client that leaves before the
+        # stream starts never leaves a subscription behind
+        subscription = await subscribe_logcat(device, tag, priority, pid, package, backlog)
+        try:
+            while not await request.is_disconnected():
+                try:
+                    entry = await asyncio.wait_for(subscription.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {orjson.dumps(entry).decode()}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @app.get('/health-router')
 def health():
     return {'status_code':200,'message':"successfull"}
\ No newline at end of file
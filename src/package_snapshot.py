@@ -0,0 +1,128 @@
+import asyncio
+import subprocess
+
+
+# How often the installed package list is diffed against the device
+PACKAGE_POLL_INTERVAL = 30
+PACKAGE_LIST_MARKER = "--third-party--"
+
+
+class PackageSnapshot:
+    """
+    In-memory view of the packages installed on one device, split into system and
+    third-party apps.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.packages = {}  # package name -> version code (None if the device doesn't report it)
+        self.third_party = set()
+        self.loaded = False
+        self.lock = asyncio.Lock()
+
+    def system_packages(self):
+        return [pkg for pkg in self.packages if pkg not in self.third_party]
+
+    def third_party_packages(self):
+        return sorted(self.third_party)
+
+    def apply(self, packages, third_party):
+        """
+        Replace the snapshot with a fresh listing and return what changed.
+        Install/uninstall show up as added/removed names, updates as version changes.
+        """
+        if not self.loaded:
+            # First listing only seeds the snapshot, the initial catalog scan labels everything
+            self.packages = packages
+            self.third_party = third_party
+            self.loaded = True
+            return {"installed": [], "uninstalled": [], "replaced": []}
+        installed = [pkg for pkg in packages if pkg not in self.packages]
+        uninstalled = [pkg for pkg in self.packages if pkg not in packages]
+        replaced = [
+            pkg for pkg, version in packages.items()
+            if pkg in self.packages and version is not None and self.packages[pkg] != version
+        ]
+        self.packages = packages
+        self.third_party = third_party
+        return {"installed": installed, "uninstalled": uninstalled, "replaced": replaced}
+
+
+def parse_package_listing(output):
+    """
+    Parse the combined `pm list packages --show-versioncode` / `pm list packages -3` output.
+    Returns ({package: version code}, set of third-party packages).
+    """
+    packages = {}
+    third_party = set()
+    in_third_party = False
+    for line in output.splitlines():
+        line = line.strip()
+        if line == PACKAGE_LIST_MARKER:
+            in_third_party = True
+            continue
+        if not line.startswith("package:"):
+            continue
+        fields = line[len("package:"):].split()
+        if not fields:
+            continue
+        name = fields[0]
+        if in_third_party:
+            third_party.add(name)
+            continue
+        version = None
+        for field in fields[1:]:
+            if field.startswith("versionCode:"):
+                version = field.split(":", 1)[1]
+        packages[name] = version
+    # Only keep third-party entries that are in the full listing
+    return packages, third_party & set(packages)
+
+
+def fetch_package_listing(device, adb=("adb",)):
+    """
+    Fetch all packages with their version codes and the third-party subset in a
+    single adb round trip, pinned to the snapshot's device.
+    """
+    try:
+        result = subprocess.run(
+            [*adb, "-s", device, "shell",
+             f"pm list packages --show-versioncode; echo {PACKAGE_LIST_MARKER}; pm list packages -3"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=10,
+            text=True
+        )
+        if result.returncode != 0:
+            raise Exception(f"ADB error: {result.stderr.strip()}")
+        return parse_package_listing(result.stdout)
+    except subprocess.TimeoutExpired:
+        raise Exception("ADB command timed out.")
+
+
+async def refresh_snapshot(snapshot, on_change=None, fetch=None):
+    """
+    Diff the device's package list into the snapshot and report the changes.
+    `fetch(device)` returns the listing, by default from adb in this process.
+    """
+    async with snapshot.lock:
+        if fetch:
+            packages, third_party = await fetch(snapshot.device)
+        else:
+            packages, third_party = await asyncio.to_thread(fetch_package_listing, snapshot.device)
+        changes = snapshot.apply(packages, third_party)
+    if on_change and any(changes.values()):
+        await on_change(snapshot, changes)
+    return changes
+
+
+async def watch_packages(snapshot, on_change=None, interval=PACKAGE_POLL_INTERVAL, fetch=None):
+    """Keep the snapshot up to date by diffing the package list on a schedule."""
+    while True:
+        try:
+            await refresh_snapshot(snapshot, on_change, fetch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Package refresh failed for {snapshot.device}: {e}")
+        await asyncio.sleep(interval)
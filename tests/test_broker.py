@@ -0,0 +1,326 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+from broker import (
+    BrokerError, DeviceRouter, HashRing, InProcessBroker, SocketBroker,
+    parse_address, parse_owners, serve_owner,
+)
+from device_owner import DeviceOwner
+
+
+OWNERS = ["owner-1", "owner-2", "owner-3"]
+DEVICES = [f"192.168.{i // 250}.{i % 250}:5555" for i in range(3000)]
+DEVICE = "192.168.1.100:5555"
+
+
+async def echo_handler(message, emit):
+    if message["op"] == "fail":
+        raise BrokerError("boom")
+    if message["op"] == "stream":
+        for index in range(message["count"]):
+            await emit({"n": index})
+        return {"done": message["count"]}
+    return {"echo": message}
+
+
+async def start_owner(handler, token=None):
+    server = await serve_owner(handler, "tcp://127.0.0.1:0", token=token)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"tcp://127.0.0.1:{port}"
+
+
+async def stop_owner(broker, server):
+    await broker.close()
+    server.close()
+    # Let the owner side see the disconnect and finish its connection task
+    await asyncio.sleep(0.05)
+
+
+def test_hash_ring_spreads_devices():
+    ring = HashRing(OWNERS)
+    counts = Counter(ring.owner(device) for device in DEVICES)
+    assert set(counts) == set(OWNERS)
+    for count in counts.values():
+        assert 0.2 < count / len(DEVICES) < 0.47
+
+
+def test_hash_ring_is_stable():
+    first = HashRing(OWNERS)
+    second = HashRing(reversed(OWNERS))
+    assert all(first.owner(device) == second.owner(device) for device in DEVICES)
+
+
+def test_hash_ring_only_moves_devices_to_an_added_owner():
+    ring = HashRing(OWNERS)
+    before = {device: ring.owner(device) for device in DEVICES}
+    ring.add("owner-4")
+    moved = [device for device in DEVICES if ring.owner(device) != before[device]]
+    assert all(ring.owner(device) == "owner-4" for device in moved)
+    assert 0.1 < len(moved) / len(DEVICES) < 0.4
+
+    ring.remove("owner-4")
+    assert {device: ring.owner(device) for device in DEVICES} == before
+
+
+def test_hash_ring_without_owners():
+    with pytest.raises(BrokerError):
+        HashRing().owner(DEVICE)
+
+
+def test_parse_owners():
+    assert parse_owners("owner-1=tcp://127.0.0.1:7001, owner-2=unix:///tmp/owner-2.sock,") == {
+        "owner-1": "tcp://127.0.0.1:7001",
+        "owner-2": "unix:///tmp/owner-2.sock",
+    }
+    assert parse_address("tcp://:7001") == ("tcp", "127.0.0.1", 7001)
+    with pytest.raises(BrokerError):
+        parse_owners("owner-1")
+    with pytest.raises(BrokerError):
+        parse_owners("owner-1=http://127.0.0.1:7001")
+
+
+def test_in_process_router_calls_the_owning_worker():
+    async def scenario():
+        broker = InProcessBroker()
+        for name in OWNERS:
+            async def handler(message, emit, name=name):
+                await emit({"owner": name})
+                return {"owner": name, "device": message["device"]}
+            broker.register(name, handler)
+        router = DeviceRouter(broker)
+        events = []
+
+        async def on_event(event):
+            events.append(event)
+
+        result = await router.call(DEVICE, "state", on_event=on_event)
+        return router.owner(DEVICE), result, events
+
+    owner, result, events = asyncio.run(scenario())
+    assert result == {"owner": owner, "device": DEVICE}
+    assert events == [{"owner": owner}]
+
+
+def test_socket_broker_streams_events_before_the_result():
+    async def scenario():
+        server, address = await start_owner(echo_handler)
+        broker = SocketBroker({"owner-1": address})
+        events = []
+
+        async def on_event(event):
+            events.append(event)
+
+        try:
+            result = await broker.call("owner-1", {"op": "stream", "count": 5}, on_event)
+            plain = await broker.call("owner-1", {"op": "state"})
+        finally:
+            await stop_owner(broker, server)
+        return result, plain, events
+
+    result, plain, events = asyncio.run(scenario())
+    assert result == {"done": 5}
+    assert plain == {"echo": {"op": "state"}}
+    assert events == [{"n": index} for index in range(5)]
+
+
+def test_socket_broker_keeps_concurrent_requests_apart():
+    async def scenario():
+        server, address = await start_owner(echo_handler)
+        broker = SocketBroker({"owner-1": address})
+        events = {3: [], 7: []}
+
+        def collector(count):
+            async def on_event(event):
+                events[count].append(event["n"])
+            return on_event
+
+        try:
+            results = await asyncio.gather(
+                broker.call("owner-1", {"op": "stream", "count": 3}, collector(3)),
+                broker.call("owner-1", {"op": "stream", "count": 7}, collector(7)),
+            )
+        finally:
+            await stop_owner(broker, server)
+        return results, events
+
+    results, events = asyncio.run(scenario())
+    assert results == [{"done": 3}, {"done": 7}]
+    assert events == {3: [0, 1, 2], 7: list(range(7))}
+
+
+def test_socket_broker_raises_owner_errors():
+    async def scenario():
+        server, address = await start_owner(echo_handler)
+        broker = SocketBroker({"owner-1": address})
+        try:
+            with pytest.raises(BrokerError, match="boom"):
+                await broker.call("owner-1", {"op": "fail"})
+            # The connection survives a failed request
+            return await broker.call("owner-1", {"op": "state"})
+        finally:
+            await stop_owner(broker, server)
+
+    assert asyncio.run(scenario()) == {"echo": {"op": "state"}}
+
+
+@pytest.mark.parametrize("client_token", [None, "wrong"])
+def test_socket_broker_rejects_a_bad_token(client_token):
+    async def scenario():
+        server, address = await start_owner(echo_handler, token="secret")
+        broker = SocketBroker({"owner-1": address}, token=client_token)
+        try:
+            with pytest.raises(BrokerError, match="Invalid broker token"):
+                await broker.call("owner-1", {"op": "state"})
+        finally:
+            await stop_owner(broker, server)
+
+    asyncio.run(scenario())
+
+
+def test_socket_broker_accepts_the_shared_token():
+    async def scenario():
+        server, address = await start_owner(echo_handler, token="secret")
+        broker = SocketBroker({"owner-1": address}, token="secret")
+        try:
+            return await broker.call("owner-1", {"op": "state"})
+        finally:
+            await stop_owner(broker, server)
+
+    assert asyncio.run(scenario()) == {"echo": {"op": "state"}}
+
+
+def test_socket_broker_cancels_the_owner_request_when_the_callback_fails():
+    async def scenario():
+        cancelled = asyncio.Event()
+
+        async def endless(message, emit):
+            try:
+                while True:
+                    await emit({"tick": True})
+                    await asyncio.sleep(0.01)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def on_event(event):
+            raise RuntimeError("websocket closed")
+
+        server, address = await start_owner(endless)
+        broker = SocketBroker({"owner-1": address})
+        try:
+            with pytest.raises(RuntimeError, match="websocket closed"):
+                await broker.call("owner-1", {"op": "logcat"}, on_event)
+            await asyncio.wait_for(cancelled.wait(), timeout=1)
+        finally:
+            await stop_owner(broker, server)
+
+    asyncio.run(scenario())
+
+
+def test_socket_broker_cancels_the_owner_request_with_the_caller():
+    async def scenario():
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def endless(message, emit):
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        server, address = await start_owner(endless)
+        broker = SocketBroker({"owner-1": address})
+        try:
+            call = asyncio.create_task(broker.call("owner-1", {"op": "logcat"}))
+            await asyncio.wait_for(started.wait(), timeout=1)
+            call.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await call
+            await asyncio.wait_for(cancelled.wait(), timeout=1)
+        finally:
+            await stop_owner(broker, server)
+
+    asyncio.run(scenario())
+
+
+def test_socket_broker_unreachable_owner():
+    async def scenario():
+        server, address = await start_owner(echo_handler)
+        server.close()
+        await server.wait_closed()
+        broker = SocketBroker({"owner-1": address})
+        with pytest.raises(BrokerError, match="unreachable"):
+            await broker.call("owner-1", {"op": "state"})
+        with pytest.raises(BrokerError, match="Unknown device owner"):
+            await broker.call("owner-2", {"op": "state"})
+
+    asyncio.run(scenario())
+
+
+def test_serve_owner_requires_a_token_off_loopback():
+    with pytest.raises(BrokerError, match="BROKER_TOKEN is required"):
+        asyncio.run(serve_owner(echo_handler, "tcp://0.0.0.0:0"))
+
+
+def in_process_owner():
+    broker = InProcessBroker()
+    owner = DeviceOwner("local")
+    broker.register("local", owner.handle)
+    return owner, DeviceRouter(broker)
+
+
+@pytest.mark.parametrize("op, payload", [
+    ("play", {"steps": [{"command": "ok", "delay": 0}], "commands": {"ok": "adb shell input keyevent 23"}}),
+    ("logcat", {}),
+])
+def test_device_owner_streaming_ops_fail_on_a_disconnected_device(op, payload):
+    _, router = in_process_owner()
+    with pytest.raises(BrokerError, match="ADB not connected"):
+        asyncio.run(router.call(DEVICE, op, **payload))
+
+
+def test_device_owner_play_on_a_disconnected_device_over_the_socket():
+    async def scenario():
+        owner = DeviceOwner("owner-1")
+        server, address = await start_owner(owner.handle)
+        broker = SocketBroker({"owner-1": address})
+        try:
+            with pytest.raises(BrokerError, match="ADB not connected"):
+                await DeviceRouter(broker).call(DEVICE, "play", steps=[], commands={})
+        finally:
+            await stop_owner(broker, server)
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("op, payload", [
+    ("run", {"command": "adb shell input keyevent 23"}),
+    ("launch", {"app_id": "com.netflix.ninja"}),
+    ("packages", {}),
+])
+def test_device_owner_reports_a_disconnected_device(op, payload):
+    _, router = in_process_owner()
+    response = asyncio.run(router.call(DEVICE, op, **payload))
+    assert response == {"status_code": 500, "error_message": "ADB not connected. Connect first."}
+
+
+def test_device_owner_state():
+    owner, router = in_process_owner()
+    assert asyncio.run(router.call(DEVICE, "state")) == {"device": DEVICE, "owner": "local", "connected": False}
+    owner.connected[DEVICE] = True
+    assert asyncio.run(router.call(DEVICE, "state"))["connected"] is True
+
+
+def test_device_owner_rejects_bad_requests():
+    owner, router = in_process_owner()
+    owner.connected[DEVICE] = True
+    with pytest.raises(BrokerError, match="Unknown operation"):
+        asyncio.run(router.call(DEVICE, "reboot"))
+    with pytest.raises(BrokerError, match="No device selected"):
+        asyncio.run(owner.handle({"op": "state"}, None))
+    with pytest.raises(BrokerError, match="No device selected"):
+        asyncio.run(router.call(None, "state"))
@@ -0,0 +1,127 @@
+import pytest
+
+from intents import INTENT_LAUNCH_DELAY, compile_intent, is_compound, parse_number, split_count
+
+
+COMMANDS = {
+    "back": "adb shell input keyevent KEYCODE_BACK",
+    "down": "adb shell input keyevent KEYCODE_DPAD_DOWN",
+    "ok": "adb shell input keyevent KEYCODE_DPAD_CENTER",
+    "mute": "adb shell input keyevent KEYCODE_VOLUME_MUTE",
+    "volume up": "adb shell input keyevent KEYCODE_VOLUME_UP",
+    "youtube": "adb shell am start -n com.google.android.youtube.tv/com.google.android.apps.youtube.tv.activity.ShellActivity",
+}
+APPS = {"tom and jerry": "com.wb.tomandjerry", "hotstar": "in.startv.hotstar"}
+
+
+def extract_keywords(text):
+    return " ".join(word for word in text.lower().split() if word not in ("open", "please"))
+
+
+def resolve_app(clause):
+    """Stands in for search_app_name: exact names, or a single word of a name."""
+    name = extract_keywords(clause)
+    if name in APPS:
+        return {"app_id": APPS[name], "app_name": name, "match": "exact"}
+    for app_name, app_id in APPS.items():
+        if name and name in app_name.split():
+            return {"app_id": app_id, "app_name": app_name, "match": "token"}
+    return None
+
+
+def compile_text(text):
+    return compile_intent(text, COMMANDS, extract_keywords, resolve_app)
+
+
+@pytest.mark.parametrize("words, expected", [
+    (["104"], 104),
+    (["one", "hundred", "four"], 104),
+    (["one", "hundred", "and", "four"], 104),
+    (["one", "oh", "four"], 104),
+    (["1", "0", "4"], 104),
+    (["twenty", "five"], 25),
+    (["two", "thousand", "and", "five"], 2005),
+    (["zero"], 0),
+    (["and", "four"], None),
+    (["channel"], None),
+    ([], None),
+])
+def test_parse_number(words, expected):
+    assert parse_number(words) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("down", (["down"], 1)),
+    ("down three", (["down"], 3)),
+    ("down three times", (["down"], 3)),
+    ("down x3", (["down"], 3)),
+    ("down to", (["down"], 2)),
+    ("down too", (["down"], 2)),
+    ("down for", (["down"], 4)),
+    ("volume up twenty five", (["volume", "up"], 25)),
+    # A lone homophone is the command, not a count
+    ("to", (["to"], 1)),
+])
+def test_split_count(text, expected):
+    assert split_count(text.split()) == expected
+
+
+@pytest.mark.parametrize("text, commands", [
+    ("down", ["down"]),
+    ("go down three", ["down", "down", "down"]),
+    ("go down three and select", ["down", "down", "down", "ok"]),
+    ("mute then volume up two", ["mute", "volume up", "volume up"]),
+    ("down, ok and back", ["down", "ok", "back"]),
+    ("louder", ["volume up"]),
+    ("channel 7", ["digit:7"]),
+    ("channel five", ["digit:5"]),
+    ("go to channel one oh four", ["digit:1", "digit:0", "digit:4"]),
+    ("channel one hundred and four", ["digit:1", "digit:0", "digit:4"]),
+    ("open tom and jerry", ["launch:com.wb.tomandjerry"]),
+    ("open tom and jerry and go down two", ["launch:com.wb.tomandjerry", "down", "down"]),
+    ("mute and open youtube", ["mute", "youtube"]),
+])
+def test_compile_intent_steps(text, commands):
+    plan = compile_text(text)
+    assert plan["errors"] == []
+    assert [step["command"] for step in plan["steps"]] == commands
+
+
+@pytest.mark.parametrize("text, delays", [
+    ("open hotstar and go down two", [0.0, INTENT_LAUNCH_DELAY, 0.0]),
+    ("youtube then down", [0.0, INTENT_LAUNCH_DELAY]),
+    ("down and ok", [0.0, 0.0]),
+])
+def test_compile_intent_launch_delay(text, delays):
+    assert [step["delay"] for step in compile_text(text)["steps"]] == delays
+
+
+def test_compile_intent_launch_command():
+    plan = compile_text("open hotstar")
+    assert "monkey -p in.startv.hotstar" in plan["commands"]["launch:in.startv.hotstar"]
+
+
+@pytest.mark.parametrize("text, error", [
+    ("back 25", "'back 25' repeats more than 20 times."),
+    ("down and fly", "Could not understand 'fly'."),
+])
+def test_compile_intent_errors(text, error):
+    assert compile_text(text)["errors"] == [error]
+
+
+@pytest.mark.parametrize("text, compound", [
+    # What /voice/ws runs by itself: a literal commands key or one app launch
+    ("down", False),
+    ("youtube", False),
+    ("open hotstar", False),
+    ("fly", False),
+    # Everything else goes through the intent path
+    ("go down three", True),
+    ("down and ok", True),
+    ("channel 7", True),
+    ("select", True),
+    ("louder", True),
+    ("back 25", True),
+])
+def test_is_compound(text, compound):
+    assert is_compound(compile_text(text), extract_keywords(text)) == compound